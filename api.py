@@ -0,0 +1,251 @@
+"""
+JSON API over the data service, registered on the Dash Flask server.
+
+Routes take their parameters as a JSON body (POST) or query string (GET).
+Filters use the AG Grid filter model format the dashboard sends, and
+"outliers" takes the dashboard's outlier settings ({"method", "threshold"}).
+"""
+
+import hashlib
+import io
+import json
+import zipfile
+
+from flask import Blueprint, Response, jsonify, request, send_file
+
+import data_service
+from comparison import cohort
+from data_service import SEARCH_COLUMNS, ServiceBusy
+from figure import METRICS, SPLITS
+from grid_columns import COLUMNS
+from image_export import IMAGE_FORMATS, STANDARD_VIEWS, ImageExportUnavailable, chart_image, render_views
+from memory_budget import MemoryBudgetExceeded
+from query import QueryTimeout, cached_query, parse_query
+from set_filters import SET_FILTER_COLUMNS
+
+MAX_ROWS = 10_000
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+# Query results and chart images only change with the data version, which the ETag covers
+QUERY_MAX_AGE = 300
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+
+def _params():
+    """Request parameters from the JSON body, falling back to the query string"""
+    params = request.get_json(silent=True)
+    if params is None:
+        params = request.args.to_dict()
+        # Structured parameters arrive JSON encoded in query strings
+        for key in ("filterModel", "outliers", "filter"):
+            if key in params:
+                params[key] = json.loads(params[key])
+    if not isinstance(params, dict) or not isinstance(params.get("filterModel") or {}, dict):
+        raise ValueError("Parameters and filterModel must be JSON objects")
+    return params
+
+
+def _columns(params):
+    """Requested columns, validated against the grid's columns"""
+    columns = params.get("columns")
+    if isinstance(columns, str):
+        columns = columns.split(",")
+    unknown = [column for column in columns or [] if column not in COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    return columns
+
+
+@api.errorhandler(ServiceBusy)
+def service_busy(error):
+    return jsonify({"error": str(error)}), 503
+
+
+@api.errorhandler(MemoryBudgetExceeded)
+def over_budget(error):
+    return jsonify({"error": str(error)}), 413
+
+
+@api.errorhandler(ImageExportUnavailable)
+def image_export_unavailable(error):
+    return jsonify({"error": str(error)}), 503
+
+
+@api.errorhandler(QueryTimeout)
+def query_timeout(error):
+    return jsonify({"error": str(error)}), 504
+
+
+@api.errorhandler(ValueError)
+def bad_request(error):
+    return jsonify({"error": str(error)}), 400
+
+
+@api.route("/filter-values/<column>", methods=["GET", "POST"])
+def filter_values(column):
+    """Set filter values for a column, narrowed by the posted filter model"""
+    if column not in SET_FILTER_COLUMNS:
+        return jsonify({"error": f"Unknown set filter column: {column}"}), 404
+    values = data_service.filter_values(column, _params().get("filterModel"))
+    return jsonify({"column": column, "values": values})
+
+
+@api.route("/rows", methods=["GET", "POST"])
+def rows():
+    """Filtered rows, paged with offset and limit (at most MAX_ROWS)"""
+    params = _params()
+    offset = int(params.get("offset", 0))
+    limit = min(int(params.get("limit", 1000)), MAX_ROWS)
+    if offset < 0 or limit < 0:
+        raise ValueError("offset and limit must not be negative")
+    data = data_service.rows(params.get("filterModel"), _columns(params), params.get("outliers"), offset=offset, limit=limit)
+    return jsonify({"offset": offset, "count": data.height, "rows": data.to_dicts()})
+
+
+@api.route("/aggregate", methods=["GET", "POST"])
+def aggregate():
+    """Yearly aggregate of the filtered rows for a metric, optionally split into series"""
+    params = _params()
+    metric = params.get("metric", "overview")
+    split = params.get("split")
+    if metric != "overview" and metric not in METRICS:
+        raise ValueError(f"Unknown metric: {metric}")
+    if split and split not in SPLITS:
+        raise ValueError(f"Unknown split: {split}")
+    data = data_service.aggregate(params.get("filterModel"), metric, split, params.get("outliers"))
+    return jsonify({"metric": metric, "split": split, "rows": data.to_dicts()})
+
+
+@api.route("/compare", methods=["GET", "POST"])
+def compare():
+    """Yearly spending and claims of two or more cohort keys within the filtered rows"""
+    params = _params()
+    keys = params.get("cohorts") or ["brand", "generic"]
+    if isinstance(keys, str):
+        keys = keys.split(",")
+    data = data_service.compare(params.get("filterModel"), [cohort(key) for key in keys], params.get("outliers"))
+    return jsonify({"cohorts": keys, "rows": data.to_dicts()})
+
+
+EXPORT_FORMATS = {".csv": "text/csv", ".parquet": "application/vnd.apache.parquet"}
+
+
+@api.route("/export.csv", methods=["GET", "POST"], defaults={"suffix": ".csv"})
+@api.route("/export.parquet", methods=["GET", "POST"], defaults={"suffix": ".parquet"})
+def export(suffix):
+    """Filtered rows as a download, streamed from a spill file so any size stays in bounded memory"""
+    params = _params()
+    path = data_service.export_file(params.get("filterModel"), _columns(params), params.get("outliers"), suffix=suffix)
+    # The open handle keeps the unlinked file readable until the response is sent
+    handle = open(path, "rb")
+    path.unlink()
+    return send_file(
+        handle,
+        mimetype=EXPORT_FORMATS[suffix],
+        as_attachment=True,
+        download_name=f"medicare_partd_drug_spending{suffix}",
+    )
+
+
+@api.route("/search")
+def search():
+    """Product, generic and manufacturer names containing `q`"""
+    params = _params()
+    text = params.get("q", "").strip()
+    if not text:
+        raise ValueError("Missing search text: q")
+    columns = params.get("columns")
+    if isinstance(columns, str):
+        columns = columns.split(",")
+    if columns and not set(columns) <= set(SEARCH_COLUMNS):
+        raise ValueError(f"Searchable columns: {', '.join(SEARCH_COLUMNS)}")
+    data = data_service.search(text, columns, min(int(params.get("limit", 20)), 100))
+    return jsonify({"q": text, "results": data.to_dicts()})
+
+
+@api.route("/trends", methods=["GET", "POST"])
+def trends():
+    """Per drug log-linear spending and $/unit trends, fastest growing first"""
+    params = _params()
+    drugs = params.get("drugs")
+    if isinstance(drugs, str):
+        drugs = drugs.split(",")
+    descending = str(params.get("descending", True)).lower() not in ("false", "0", "no")
+    limit = min(int(params.get("limit", 100)), MAX_ROWS)
+    sort = params.get("sort", "spending_growth")
+    data = data_service.trends(drugs, sort, descending, limit)
+    return jsonify({"sort": sort, "rows": data.to_dicts()})
+
+
+@api.route("/query", methods=["GET", "POST"])
+def query():
+    """
+    Aggregate query: filter, group_by and metrics, returned as JSON or Arrow IPC
+
+    Set format=arrow (or Accept: application/vnd.apache.arrow.stream) for an
+    Arrow IPC stream. Results are cached per data version.
+    """
+    params = _params()
+    spec = parse_query(params)
+    key, data = cached_query(spec)
+
+    arrow = params.get("format") == "arrow" or request.accept_mimetypes.best == ARROW_MIMETYPE
+    if arrow:
+        buffer = io.BytesIO()
+        data.write_ipc_stream(buffer)
+        response = Response(buffer.getvalue(), mimetype=ARROW_MIMETYPE)
+    else:
+        response = jsonify({"query": spec, "columns": data.columns, "rows": data.to_dicts()})
+    response.set_etag(hashlib.sha1(f"{key}{arrow}".encode()).hexdigest())
+    response.cache_control.public = True
+    response.cache_control.max_age = QUERY_MAX_AGE
+    return response.make_conditional(request)
+
+
+def _image_options(params):
+    """Image size and forecast options from request parameters"""
+    options = {key: params[key] for key in ("width", "height", "scale") if key in params}
+    options["forecast"] = str(params.get("forecast", "")).lower() in ("1", "true", "yes")
+    return options
+
+
+@api.route("/chart.<fmt>", methods=["GET", "POST"])
+def chart(fmt):
+    """
+    The spending chart rendered to PNG, SVG or PDF
+
+    Takes a filterModel (and outliers), or view=<standard view>, plus
+    width, height, scale and forecast. Rendered images are cached per data version.
+    """
+    if fmt not in IMAGE_FORMATS:
+        return jsonify({"error": f"Unknown image format: {fmt}"}), 404
+    params = _params()
+    view = params.get("view")
+    if view:
+        if view not in STANDARD_VIEWS:
+            raise ValueError(f"Unknown view: {view}. Views: {', '.join(STANDARD_VIEWS)}")
+        label, filter_model = STANDARD_VIEWS[view]
+        key, image = chart_image(filter_model, label=label, fmt=fmt, **_image_options(params))
+    else:
+        key, image = chart_image(params.get("filterModel"), params.get("outliers"), fmt=fmt, **_image_options(params))
+
+    response = Response(image, mimetype=IMAGE_FORMATS[fmt])
+    response.set_etag(hashlib.sha1(key.encode()).hexdigest())
+    response.cache_control.public = True
+    response.cache_control.max_age = QUERY_MAX_AGE
+    return response.make_conditional(request)
+
+
+@api.route("/charts.zip")
+def charts():
+    """Standard views (overall, brand, generic, specialty) rendered in one zip for reports"""
+    params = _params()
+    fmt = params.get("format", "png")
+    views = params.get("views")
+    rendered = render_views(views.split(",") if views else None, fmt, **_image_options(params))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, image in rendered.items():
+            archive.writestr(f"partd_{name}.{fmt}", image)
+    buffer.seek(0)
+    return send_file(buffer, mimetype="application/zip", as_attachment=True, download_name="partd_charts.zip")
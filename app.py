@@ -6,16 +6,30 @@ Medicare Part D drug spending data from CMS.
 """
 
 import dash_mantine_components as dmc
-from dash import Dash, Input, Output, State, callback, dcc, html, get_asset_url
+from dash import Dash, Input, Output, State, callback, ctx, dcc, html, get_asset_url, no_update
+from flask import Response, request, send_from_directory
 import dash_ag_grid as dag
 from ag_grid_definition import component
-import polars as pl
+from grid_columns import columnDefs, load_grid_rows, visible_fields
 from dash.exceptions import PreventUpdate
-from figure import create_partd_figure, aggregate_chart_data
+from figure import create_partd_figure, create_metric_figure, create_comparison_figure, METRICS, SPLITS
+from comparison import cohort, cohort_options, comparison_deltas
 from dash_iconify import DashIconify
-from helpers import load_data
+from forecast import forecast_chart_data
+from outliers import OUTLIER_METHODS, DEFAULT_THRESHOLDS
+from session_cache import warm_selection_index
+import data_service
+from api import api
+from snapshot import app_fingerprint, load_snapshot, read_snapshot_file, SNAPSHOT_DIR, SNAPSHOT_MAX_AGE, LAYOUT
+from helpers import data_version
+from set_filters import precompute_set_filters
+import copy
 import io
 import csv
+import gzip
+import json
+from urllib.parse import urlencode
+from functools import lru_cache
 
 app = Dash(
     external_stylesheets=dmc.styles.ALL,
@@ -24,6 +38,51 @@ app = Dash(
 )
 
 server = app.server
+precompute_set_filters()
+warm_selection_index()
+
+# Filled by update_fig's initial call, or pre-rendered in the snapshot layout
+DEFAULT_FIGURE = {"data": [], "layout": {}}
+
+
+@lru_cache(maxsize=1)
+def _fingerprint(version):
+    """The app's fingerprint; the layout only changes with the data version"""
+    return app_fingerprint(app)
+
+
+def snapshot_fingerprint():
+    """The running app's fingerprint, compared against the snapshot's"""
+    return _fingerprint(data_version())
+
+
+@server.before_request
+def serve_snapshot_layout():
+    """Serve the pre-rendered default layout from `python snapshot.py` while it matches the data and app"""
+    if request.path != app.config.routes_pathname_prefix + "_dash-layout":
+        return None
+    if load_snapshot(snapshot_fingerprint()) is None:
+        return None
+    body = read_snapshot_file(LAYOUT)
+    response = Response(mimetype="application/json")
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        response.set_data(body)
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response.set_data(gzip.decompress(body))
+    response.headers["Cache-Control"] = f"public, max-age={SNAPSHOT_MAX_AGE}"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+server.register_blueprint(api)
+
+
+@server.route("/snapshot/<path:filename>")
+def snapshot_file(filename):
+    """Static snapshot files (default figure and pre-aggregated datasets)"""
+    return send_from_directory(SNAPSHOT_DIR, filename, max_age=SNAPSHOT_MAX_AGE)
+
 
 # Create layout inspired by 46brooklyn design
 layout = dmc.Container(
@@ -610,11 +669,75 @@ layout = dmc.Container(
                                     ],
                                     gap="sm",
                                 ),
-                                dmc.Badge("Live Updates", color="orange", variant="light"),
+                                dmc.Group(
+                                    [
+                                        dmc.Select(
+                                            id="chart-metric",
+                                            data=[{"value": "overview", "label": "Spending & $/Claim"}] + [
+                                                {"value": metric, "label": definition["label"]}
+                                                for metric, definition in METRICS.items()
+                                            ],
+                                            value="overview",
+                                            allowDeselect=False,
+                                            size="sm",
+                                            w=220,
+                                        ),
+                                        dmc.Select(
+                                            id="chart-split",
+                                            data=[{"value": split, "label": label} for split, label in SPLITS.items()],
+                                            placeholder="No split",
+                                            clearable=True,
+                                            size="sm",
+                                            w=180,
+                                        ),
+                                        dmc.Switch(
+                                            id="chart-forecast",
+                                            label="Forecast",
+                                            checked=False,
+                                            color="orange",
+                                            styles={"label": {"color": "white"}},
+                                        ),
+                                        dmc.Badge("Live Updates", color="orange", variant="light"),
+                                    ],
+                                    gap="sm",
+                                ),
                             ],
                             justify="space-between",
                             align="center",
                         ),
+                        # Cohort comparison controls
+                        dmc.Group(
+                            [
+                                dmc.Switch(
+                                    id="compare-mode",
+                                    label="Compare cohorts",
+                                    checked=False,
+                                    color="orange",
+                                    styles={"label": {"color": "white"}},
+                                ),
+                                dmc.Select(
+                                    id="cohort-a",
+                                    data=cohort_options(),
+                                    value="brand",
+                                    allowDeselect=False,
+                                    searchable=True,
+                                    size="sm",
+                                    w=220,
+                                ),
+                                dmc.Text("vs", size="sm", c="white"),
+                                dmc.Select(
+                                    id="cohort-b",
+                                    data=cohort_options(),
+                                    value="generic",
+                                    allowDeselect=False,
+                                    searchable=True,
+                                    size="sm",
+                                    w=220,
+                                ),
+                            ],
+                            gap="sm",
+                            justify="flex-end",
+                        ),
                     ],
                     gap="sm",
                 ),
@@ -629,6 +752,7 @@ layout = dmc.Container(
             [
                 dcc.Graph(
                     id='fig',
+                    figure=DEFAULT_FIGURE,
                     config={
                         'displayModeBar': True,
                         'displaylogo': False,
@@ -646,6 +770,9 @@ layout = dmc.Container(
             className="partd-chart-container",
         ),
         
+        # Cohort comparison delta table, filled in comparison mode
+        html.Div(id="comparison-table"),
+        
         # Data Table Section - Professional Header with Download
         dmc.Paper(
             [
@@ -669,6 +796,41 @@ layout = dmc.Container(
                                 dmc.Group(
                                     [
                                         dmc.Badge("Filter & Sort", color="orange", variant="light"),
+                                        dmc.Select(
+                                            id="outlier-method",
+                                            data=[{"value": "source", "label": "CMS outlier flags"}] + [
+                                                {"value": method, "label": label}
+                                                for method, label in OUTLIER_METHODS.items()
+                                            ],
+                                            value="source",
+                                            allowDeselect=False,
+                                            size="sm",
+                                            w=180,
+                                        ),
+                                        dmc.NumberInput(
+                                            id="outlier-threshold",
+                                            value=DEFAULT_THRESHOLDS["zscore"],
+                                            min=0.5,
+                                            step=0.5,
+                                            decimalScale=2,
+                                            disabled=True,
+                                            size="sm",
+                                            w=90,
+                                        ),
+                                        dmc.MultiSelect(
+                                            id="column-picker",
+                                            data=[
+                                                {"value": col_def["field"], "label": col_def["headerName"]}
+                                                for col_def in columnDefs
+                                            ],
+                                            value=visible_fields(columnDefs),
+                                            placeholder="Columns",
+                                            size="sm",
+                                            w=260,
+                                            maxValues=len(columnDefs),
+                                            clearable=False,
+                                            comboboxProps={"withinPortal": True},
+                                        ),
                                         dmc.Button(
                                             [
                                                 DashIconify(icon="tabler:download", width=16),
@@ -701,6 +863,20 @@ layout = dmc.Container(
         
         # Download Component
         dcc.Download(id="download-csv"),
+        # Exports over the memory budget navigate here to the streamed CSV route instead
+        dcc.Location(id="export-location", refresh=True),
+        
+        # Columns currently present in the grid's rowData
+        dcc.Store(id="grid-loaded-columns", data=visible_fields(columnDefs)),
+        
+        # Outlier settings shared by the grid, chart and export
+        dcc.Store(id="outlier-params", data=None),
+        
+        # Browser session id keying the server-side selection cache
+        dcc.Store(id="session-id", storage_type="session"),
+        
+        # Data version of a pre-rendered snapshot layout; None in the dynamic layout
+        dcc.Store(id="snapshot-version", data=None),
         
         
         
@@ -737,28 +913,173 @@ layout = dmc.Container(
     py="lg",
 )
 
-app.layout = dmc.MantineProvider(layout)
+@lru_cache(maxsize=1)
+def _versioned_layout(version):
+    """The layout with grid rows and cohort options loaded from one data version"""
+    page = copy.deepcopy(layout)
+    for item in page._traverse():
+        item_id = getattr(item, "id", None)
+        if item_id == "ag-grid":
+            item.rowData = load_grid_rows(visible_fields(columnDefs))
+        elif item_id in ("cohort-a", "cohort-b"):
+            item.data = cohort_options()
+    return dmc.MantineProvider(page)
+
 
+def serve_layout():
+    """Page layout per visit, so grid rows and cohort pickers pick up appended years without a restart"""
+    return _versioned_layout(data_version())
+
+
+app.layout = serve_layout
+
+
+def comparison_table(deltas, label_a, label_b):
+    """Year by year delta table for two compared cohorts"""
+    def money(value, spec=",.0f"):
+        return "-" if value is None else f"${value:{spec}}"
+    
+    def percent(value):
+        return "-" if value is None else f"{value:+.1%}"
+    
+    return dmc.Paper(
+        dmc.Table(
+            data={
+                "head": [
+                    "Year",
+                    f"{label_a} Spending", f"{label_b} Spending", "Spending Δ", "Spending Δ %",
+                    f"{label_a} $/Claim", f"{label_b} $/Claim", "$/Claim Δ",
+                ],
+                "body": [
+                    [
+                        row["year"],
+                        money(row["spending_a"]), money(row["spending_b"]), money(row["spending_delta"]),
+                        percent(row["spending_delta_pct"]),
+                        money(row["per_claim_a"], ",.2f"), money(row["per_claim_b"], ",.2f"),
+                        money(row["per_claim_delta"], ",.2f"),
+                    ]
+                    for row in deltas.iter_rows(named=True)
+                ],
+            },
+            striped=True,
+            highlightOnHover=True,
+            fz="sm",
+        ),
+        p="md",
+        className="brooklyn-card",
+    )
 
 @callback(
     Output('fig', 'figure'),
-    Input('ag-grid', 'virtualRowData')
+    Output('comparison-table', 'children'),
+    Input('ag-grid', 'filterModel'),
+    Input('chart-metric', 'value'),
+    Input('chart-split', 'value'),
+    Input('chart-forecast', 'checked'),
+    Input('outlier-params', 'data'),
+    Input('compare-mode', 'checked'),
+    Input('cohort-a', 'value'),
+    Input('cohort-b', 'value'),
+    State('session-id', 'data'),
+    State('snapshot-version', 'data'),
 )
-def update_fig(virtual_row_data):
-    if not virtual_row_data:
+def update_fig(filter_model, metric="overview", split=None, show_forecast=False, outlier_params=None,
+               compare=False, cohort_a="brand", cohort_b="generic", session_id=None, snapshot_version=None):
+    # A current snapshot layout already carries the default figure
+    if snapshot_version is not None and ctx.triggered_id is None and snapshot_version == data_version():
         raise PreventUpdate
-        
+    
+    # The default overview plots spending and $/claim together; splitting it plots spending per series
+    if metric in (None, "overview") and split:
+        metric = "Total_Spending"
+    
+    if compare:
+        return update_comparison(filter_model, outlier_params, cohort_a, cohort_b, session_id)
+    
     try:
-        data = pl.DataFrame(
-            virtual_row_data, 
-            strict=False
-        )
+        # Chart controls reuse the session's current selection instead of re-filtering
+        data = data_service.aggregate(filter_model, metric, split, outlier_params, session_id)
     except Exception as e:
         print(f"Error updating visualizations: {e}")
         raise PreventUpdate
-    data = aggregate_chart_data(data)
-    fig = create_partd_figure(data)
-    return fig
+    if data.is_empty():
+        raise PreventUpdate
+    
+    if metric in (None, "overview"):
+        forecast = forecast_chart_data(data) if show_forecast else None
+        return create_partd_figure(data, forecast), None
+    return create_metric_figure(data, metric, split), None
+
+def update_comparison(filter_model, outlier_params, cohort_a, cohort_b, session_id):
+    """Comparison mode: both cohorts within the grid's current selection, aggregated in one query"""
+    try:
+        (label_a, model_a), (label_b, model_b) = cohort(cohort_a), cohort(cohort_b)
+        if label_a == label_b:
+            label_b = f"{label_b} (B)"
+        cohorts = [(label_a, model_a), (label_b, model_b)]
+        data = data_service.compare(filter_model, cohorts, outlier_params, session_id)
+    except Exception as e:
+        print(f"Error updating comparison: {e}")
+        raise PreventUpdate
+    if data.is_empty():
+        raise PreventUpdate
+    
+    deltas = comparison_deltas(data, label_a, label_b)
+    return create_comparison_figure(data), comparison_table(deltas, label_a, label_b)
+
+@callback(
+    Output("outlier-params", "data"),
+    Output("outlier-threshold", "disabled"),
+    Output("outlier-threshold", "value"),
+    Input("outlier-method", "value"),
+    Input("outlier-threshold", "value"),
+    prevent_initial_call=True,
+)
+def update_outlier_params(method, threshold):
+    if method in (None, "source"):
+        return None, True, no_update
+    # Switching method resets the threshold to that method's default
+    if ctx.triggered_id == "outlier-method" or not isinstance(threshold, (int, float)):
+        threshold = DEFAULT_THRESHOLDS[method]
+        return {"method": method, "threshold": threshold}, False, threshold
+    return {"method": method, "threshold": threshold}, False, no_update
+
+@callback(
+    Output("ag-grid", "columnDefs"),
+    Output("ag-grid", "rowData"),
+    Output("grid-loaded-columns", "data"),
+    Input("column-picker", "value"),
+    Input("outlier-params", "data"),
+    State("grid-loaded-columns", "data"),
+    prevent_initial_call=True,
+)
+def update_grid(visible, outlier_params, loaded_columns):
+    if not visible:
+        raise PreventUpdate
+    
+    column_defs = [{**col_def, "hide": col_def["field"] not in visible} for col_def in columnDefs]
+    reflag = ctx.triggered_id == "outlier-params" and "Outlier_Flag" in loaded_columns
+    if set(visible) <= set(loaded_columns) and not reflag:
+        return column_defs, no_update, no_update
+    
+    # Hidden columns are only fetched once they are shown
+    fields = [col_def["field"] for col_def in columnDefs if col_def["field"] in visible or col_def["field"] in loaded_columns]
+    return column_defs, data_service.grid_rows(fields, outlier_params), fields
+
+# Assign each browser session an id once, client-side
+app.clientside_callback(
+    """
+    function(timestamp, sessionId) {
+        if (sessionId) {
+            return window.dash_clientside.no_update;
+        }
+        return window.crypto.randomUUID ? window.crypto.randomUUID() : String(Date.now()) + Math.random().toString(16).slice(2);
+    }
+    """,
+    Output("session-id", "data"),
+    Input("session-id", "modified_timestamp"),
+    State("session-id", "data"),
+)
 
 # Modal callbacks
 @callback(
@@ -796,30 +1117,34 @@ def open_data_sources_modal(n_clicks):
 # Download callback
 @callback(
     Output("download-csv", "data"),
+    Output("export-location", "href"),
     Input("download-button", "n_clicks"),
-    State("ag-grid", "virtualRowData"),
+    State("ag-grid", "filterModel"),
+    State("column-picker", "value"),
+    State("outlier-params", "data"),
+    State("session-id", "data"),
     prevent_initial_call=True,
 )
-def download_csv(n_clicks, virtual_row_data):
+def download_csv(n_clicks, filter_model, visible, outlier_params=None, session_id=None):
     if n_clicks is None:
         raise PreventUpdate
     
-    # If there's filtered data, use that; otherwise use all data
-    if virtual_row_data:
-        df = pl.DataFrame(virtual_row_data, strict=False)
-    else:
-        df = load_data().collect()
+    # Export the session's filtered rows, gathering only the visible columns
+    columns = [col_def["field"] for col_def in columnDefs if col_def["field"] in (visible or [])] or visible_fields(columnDefs)
     
-    # Convert to pandas for easier CSV export
-    df_pandas = df.to_pandas()
+    # Large exports stream from disk instead of passing through the callback response
+    if not data_service.export_fits(filter_model, columns, outlier_params, session_id):
+        query = {"columns": ",".join(columns), "filterModel": json.dumps(filter_model or {})}
+        if outlier_params:
+            query["outliers"] = json.dumps(outlier_params)
+        return no_update, f"/api/export.csv?{urlencode(query)}"
     
-    # Create CSV string
-    csv_string = df_pandas.to_csv(index=False)
+    csv_string = data_service.export_csv(filter_model, columns, outlier_params, session_id)
     
     return dict(
         content=csv_string,
         filename="medicare_partd_drug_spending.csv"
-    )
+    ), no_update
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
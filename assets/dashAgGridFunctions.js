@@ -0,0 +1,15 @@
+var dagfuncs = (window.dashAgGridFunctions = window.dashAgGridFunctions || {});
+
+// Set filter values are served by the app, narrowed by the grid's other active filters
+dagfuncs.partdSetFilterValues = function (params) {
+    const column = params.colDef.field;
+    const filterModel = params.api ? params.api.getFilterModel() : {};
+    fetch("/api/filter-values/" + encodeURIComponent(column), {
+        method: "POST",
+        headers: {"Content-Type": "application/json"},
+        body: JSON.stringify({filterModel: filterModel}),
+    })
+        .then((response) => response.json())
+        .then((data) => params.success(data.values.map((item) => item.value)))
+        .catch(() => params.success([]));
+};
@@ -0,0 +1,146 @@
+"""
+Side-by-side comparison of two filtered cohorts.
+
+Both cohorts are evaluated in one grouped query: each cohort's filter model
+becomes a boolean membership expression and every YEAR group sums spending
+and claims under each membership. A row can belong to both cohorts, and
+the data is scanned once however the cohorts overlap.
+"""
+
+from functools import lru_cache
+
+import polars as pl
+from polars import col as c
+
+from filter_model import filter_columns, filter_expr
+from helpers import data_version, load_data
+from profiling import collect
+
+COMPARISON_COLUMNS = ['YEAR', 'Total_Spending', 'Total_Claims']
+
+# Cohorts selectable in the dashboard; text "equals" matches case-insensitively, so "brand" covers BRAND and Brand
+COHORT_PRESETS = {
+    'brand': ('Brand', {'Brand_vs_Generic': {'filterType': 'text', 'type': 'equals', 'filter': 'brand'}}),
+    'generic': ('Generic', {'Brand_vs_Generic': {'filterType': 'text', 'type': 'equals', 'filter': 'generic'}}),
+    'specialty': ('Specialty', {'SPECIALTY_DRUG': {'filterType': 'text', 'type': 'equals', 'filter': 'true'}}),
+    'non_specialty': ('Non-Specialty', {'SPECIALTY_DRUG': {'filterType': 'text', 'type': 'equals', 'filter': 'false'}}),
+}
+MANUFACTURER_PREFIX = 'manufacturer:'
+
+
+def cohort(key):
+    """
+    Resolve a cohort key to its label and filter model
+
+    Args:
+        key: A COHORT_PRESETS key or 'manufacturer:<name>'
+
+    Returns:
+        tuple: (label, filter model)
+    """
+    if key in COHORT_PRESETS:
+        return COHORT_PRESETS[key]
+    if key and key.startswith(MANUFACTURER_PREFIX):
+        name = key[len(MANUFACTURER_PREFIX):]
+        return name, {'Manufacturer': {'filterType': 'set', 'values': [name]}}
+    raise ValueError(f"Unknown cohort: {key}")
+
+
+@lru_cache(maxsize=4)
+def _top_manufacturers(version, n):
+    """Manufacturers with the highest total spending, cached per data version"""
+    return collect(
+        load_data(['Manufacturer', 'Total_Spending'])
+        .drop_nulls('Manufacturer')
+        .group_by('Manufacturer')
+        .agg(c.Total_Spending.sum())
+        .top_k(n, by='Total_Spending'),
+        "top_manufacturers",
+    )['Manufacturer'].to_list()
+
+
+def cohort_options(n_manufacturers=25):
+    """Select options for the cohort pickers: presets, then top manufacturers by spending"""
+    options = [{'value': key, 'label': label} for key, (label, _) in COHORT_PRESETS.items()]
+    options += [
+        {'value': f'{MANUFACTURER_PREFIX}{name}', 'label': name}
+        for name in _top_manufacturers(data_version(), n_manufacturers)
+    ]
+    return options
+
+
+def cohort_columns(cohorts):
+    """Columns compare_cohorts reads for the given (label, filter model) cohorts"""
+    columns = list(COMPARISON_COLUMNS)
+    for _, filter_model in cohorts:
+        columns += [column for column in filter_columns(filter_model) if column not in columns]
+    return columns
+
+
+def compare_cohorts(data, cohorts):
+    """
+    Aggregate spending and claims per year for each cohort in one grouped query
+
+    Args:
+        data: Polars LazyFrame or DataFrame containing cohort_columns(cohorts)
+        cohorts: List of (label, filter model) pairs
+
+    Returns:
+        Polars LazyFrame or DataFrame with columns 'year', 'cohort',
+        'total_spending', 'total_claims', 'per_claim'
+    """
+    aggregations = []
+    for i, (_, filter_model) in enumerate(cohorts):
+        member = filter_expr(filter_model).fill_null(False)
+        aggregations += [
+            c.Total_Spending.filter(member).sum().alias(f'spending_{i}'),
+            c.Total_Claims.filter(member).sum().alias(f'claims_{i}'),
+        ]
+    wide = data.group_by('YEAR').agg(aggregations)
+
+    # Reshape to one row per year and cohort
+    return (
+        pl.concat([
+            wide.select(
+                c.YEAR.alias('year'),
+                pl.lit(label).alias('cohort'),
+                c(f'spending_{i}').alias('total_spending'),
+                c(f'claims_{i}').alias('total_claims'),
+            )
+            for i, (label, _) in enumerate(cohorts)
+        ])
+        .with_columns(pl.when(c.total_claims > 0).then(c.total_spending / c.total_claims).alias('per_claim'))
+        .sort(['year', 'cohort'])
+    )
+
+
+def comparison_deltas(dataframe, first, second):
+    """
+    Year by year difference between two cohorts
+
+    Args:
+        dataframe: Polars DataFrame from compare_cohorts
+        first: Label of the baseline cohort
+        second: Label of the cohort compared against it
+
+    Returns:
+        Polars DataFrame with each cohort's spending and per claim values,
+        plus the absolute and percent difference (second - first)
+    """
+    def cohort_frame(label, suffix):
+        return dataframe.filter(c.cohort == label).select(
+            'year',
+            c.total_spending.alias(f'spending_{suffix}'),
+            c.per_claim.alias(f'per_claim_{suffix}'),
+        )
+
+    return (
+        cohort_frame(first, 'a')
+        .join(cohort_frame(second, 'b'), on='year', how='full', coalesce=True)
+        .with_columns(
+            (c.spending_b - c.spending_a).alias('spending_delta'),
+            pl.when(c.spending_a != 0).then((c.spending_b - c.spending_a) / c.spending_a).alias('spending_delta_pct'),
+            (c.per_claim_b - c.per_claim_a).alias('per_claim_delta'),
+        )
+        .sort('year')
+    )
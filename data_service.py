@@ -0,0 +1,263 @@
+"""
+Data service shared by the Dash callbacks and the JSON API.
+
+Every dataset query (grid rows, chart aggregates, cohort comparisons,
+exports, search and set filter values) runs on one bounded thread pool, so
+dashboard callbacks and API consumers share a single concurrency limit.
+Each query is exposed twice: a blocking function for Flask and Dash request
+threads, and an `_async` variant for asyncio callers.
+"""
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import polars as pl
+from polars import col as c
+
+from comparison import cohort_columns, compare_cohorts
+from figure import CHART_COLUMNS, METRICS, aggregate_chart_data, aggregate_series, metric_columns
+from forecast import drug_trends
+from grid_columns import load_grid_rows
+from helpers import load_data
+from incremental import Maintained, merge_sums
+from outliers import outlier_flags_for
+from profiling import collect
+from memory_budget import within_budget
+from session_cache import base_frame, selections
+from set_filters import set_filter_values
+
+DATA_WORKERS = int(os.environ.get("PARTD_DATA_WORKERS", min(4, os.cpu_count() or 1)))
+# Queries queued or running at once; callers wait up to QUEUE_TIMEOUT seconds for a slot
+MAX_PENDING = int(os.environ.get("PARTD_DATA_MAX_PENDING", DATA_WORKERS * 8))
+QUEUE_TIMEOUT = float(os.environ.get("PARTD_DATA_QUEUE_TIMEOUT", 30))
+
+SEARCH_COLUMNS = ["Product_Name", "Generic_Name", "Manufacturer"]
+
+_executor = ThreadPoolExecutor(max_workers=DATA_WORKERS, thread_name_prefix="partd-data")
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+
+
+class ServiceBusy(RuntimeError):
+    """Raised when no query slot frees up within the queue timeout"""
+
+
+def submit(fn, *args, queue_timeout=QUEUE_TIMEOUT, **kwargs):
+    """
+    Queue a function on the data pool
+
+    Args:
+        queue_timeout: Seconds to wait for a query slot
+
+    Returns:
+        concurrent.futures.Future: The function's result
+
+    Raises:
+        ServiceBusy: MAX_PENDING queries stayed queued or running for `queue_timeout` seconds
+    """
+    if not _pending.acquire(timeout=queue_timeout):
+        raise ServiceBusy(f"Data service busy: {MAX_PENDING} queries pending")
+    try:
+        future = _executor.submit(fn, *args, **kwargs)
+    except BaseException:
+        _pending.release()
+        raise
+    future.add_done_callback(lambda _: _pending.release())
+    return future
+
+
+def run(fn, *args, **kwargs):
+    """Run a function on the data pool and wait for its result"""
+    return submit(fn, *args, **kwargs).result()
+
+
+async def run_async(fn, *args, **kwargs):
+    """Run a function on the data pool without blocking the event loop"""
+    # Waiting for a queue slot blocks, so it happens off the event loop too
+    future = await asyncio.to_thread(submit, fn, *args, **kwargs)
+    return await asyncio.wrap_future(future)
+
+
+def _service(query):
+    """Blocking and async entry points that run `query` on the data pool"""
+    @functools.wraps(query)
+    def blocking(*args, **kwargs):
+        return run(query, *args, **kwargs)
+
+    @functools.wraps(query)
+    async def awaitable(*args, **kwargs):
+        return await run_async(query, *args, **kwargs)
+
+    return blocking, awaitable
+
+
+def _rows(filter_model=None, columns=None, outlier_params=None, session_id=None, offset=0, limit=None):
+    """
+    Rows matching a filter model
+
+    Args:
+        filter_model: AG Grid filter model
+        columns: Columns to return (all when None)
+        outlier_params: The dashboard's outlier settings
+        session_id: Browser session whose cached selection to reuse; None disables caching
+        offset: First row to return
+        limit: Maximum number of rows (all when None)
+
+    Returns:
+        polars.DataFrame: Matching rows in dataset order
+    """
+    return selections.rows(session_id, filter_model, columns, outlier_params, offset, limit)
+
+
+def _aggregate(filter_model=None, metric="overview", split=None, outlier_params=None, session_id=None):
+    """
+    Yearly chart aggregate of the rows matching a filter model
+
+    Returns:
+        polars.DataFrame: year, total_spending, total_claims and per_claim for
+        the "overview" metric, otherwise year, series and value per aggregate_series
+    """
+    if metric in (None, "overview"):
+        # The unfiltered overview comes straight from the maintained yearly totals
+        if not filter_model:
+            return collect(aggregate_chart_data(yearly_totals.get().lazy()), "chart_aggregate")
+        rows = selections.lazy_rows(session_id, filter_model, CHART_COLUMNS, outlier_params)
+        return collect(aggregate_chart_data(rows), "chart_aggregate", filters=filter_model, engine="streaming")
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric: {metric}")
+    rows = selections.lazy_rows(session_id, filter_model, metric_columns(metric, split), outlier_params)
+    return collect(
+        aggregate_series(rows, metric, split),
+        "chart_series",
+        filters={"filterModel": filter_model, "metric": metric, "split": split},
+        engine="streaming",
+    )
+
+
+def _compare(filter_model, cohorts, outlier_params=None, session_id=None):
+    """Yearly spending and claims of (label, filter model) cohorts within a filter model's rows"""
+    rows = selections.lazy_rows(session_id, filter_model, cohort_columns(cohorts), outlier_params)
+    return collect(
+        compare_cohorts(rows, cohorts),
+        "cohort_comparison",
+        filters={"filterModel": filter_model, "cohorts": [label for label, _ in cohorts]},
+        engine="streaming",
+    )
+
+
+def _export_csv(filter_model=None, columns=None, outlier_params=None, session_id=None):
+    """Rows matching a filter model as a CSV string; raises MemoryBudgetExceeded when too large"""
+    return selections.rows(session_id, filter_model, columns, outlier_params).write_csv()
+
+
+def _export_fits(filter_model=None, columns=None, outlier_params=None, session_id=None):
+    """Whether an export fits the memory budget, or should be streamed from a spill file"""
+    frame = base_frame().select(columns) if columns else base_frame()
+    return within_budget(selections.count(session_id, filter_model, outlier_params), frame)
+
+
+def _export_file(filter_model=None, columns=None, outlier_params=None, session_id=None, suffix=".csv"):
+    """Rows matching a filter model streamed to a spill CSV or parquet file; the caller deletes it"""
+    return selections.export_file(session_id, filter_model, columns, outlier_params, suffix)
+
+
+def _grid_rows(fields, outlier_params=None):
+    """Grid rowData holding only the given fields"""
+    return load_grid_rows(fields, outlier_flags_for(outlier_params))
+
+
+def _search_totals(files):
+    """Total spending per distinct searchable value in the given data files"""
+    data = load_data(SEARCH_COLUMNS + ["Total_Spending"], files)
+    return collect(
+        pl.concat([
+            data
+            .drop_nulls(column)
+            .group_by(c(column).alias("value"))
+            .agg(c.Total_Spending.sum().alias("total_spending"))
+            .select(pl.lit(column).alias("column"), "value", "total_spending")
+            for column in SEARCH_COLUMNS
+        ]),
+        "search_index",
+    )
+
+
+# Searchable values with their spending; sums are additive, so appended years are merged in
+search_index = Maintained(
+    "search_index",
+    build=_search_totals,
+    extend=lambda index, files: merge_sums(index, _search_totals(files), ["column", "value"]),
+)
+
+
+def _yearly_totals(files):
+    """Spending and claims per YEAR in the given data files"""
+    return collect(
+        load_data(CHART_COLUMNS, files).group_by("YEAR").agg(c.Total_Spending.sum(), c.Total_Claims.sum()),
+        "yearly_totals",
+    )
+
+
+# Unfiltered chart totals; a new year only adds its own row
+yearly_totals = Maintained(
+    "yearly_totals",
+    build=_yearly_totals,
+    extend=lambda totals, files: merge_sums(totals, _yearly_totals(files), ["YEAR"]),
+)
+
+
+def _search(text, columns=None, limit=20):
+    """
+    Product, generic and manufacturer names containing the search text
+
+    Args:
+        text: Case-insensitive substring to search for
+        columns: Subset of SEARCH_COLUMNS to search (all when None)
+        limit: Maximum number of matches
+
+    Returns:
+        polars.DataFrame: column, value and total_spending, highest spending first
+    """
+    matches = search_index.get().filter(c.value.str.to_lowercase().str.contains(text.lower(), literal=True))
+    if columns:
+        matches = matches.filter(c.column.is_in(columns))
+    return matches.sort("total_spending", descending=True, nulls_last=True).head(limit)
+
+
+TREND_SORTS = ["spending_growth", "per_unit_growth"]
+
+
+def _trends(drugs=None, sort="spending_growth", descending=True, limit=100):
+    """
+    Fitted per drug spending and $/unit trends
+
+    Args:
+        drugs: Generic names to return (all when None)
+        sort: Growth column to order by, one of TREND_SORTS
+        descending: Fastest growing first
+        limit: Maximum number of drugs
+
+    Returns:
+        polars.DataFrame: Generic_Name with slope, intercept and annual growth
+        for 'spending' and 'per_unit'; drugs without a fit sort last
+    """
+    if sort not in TREND_SORTS:
+        raise ValueError(f"sort must be one of: {', '.join(TREND_SORTS)}")
+    fits = drug_trends()
+    if drugs:
+        fits = fits.filter(c.Generic_Name.is_in(drugs))
+    return fits.sort(sort, descending=descending, nulls_last=True).head(limit)
+
+
+rows, rows_async = _service(_rows)
+aggregate, aggregate_async = _service(_aggregate)
+compare, compare_async = _service(_compare)
+export_csv, export_csv_async = _service(_export_csv)
+export_fits, export_fits_async = _service(_export_fits)
+export_file, export_file_async = _service(_export_file)
+grid_rows, grid_rows_async = _service(_grid_rows)
+search, search_async = _service(_search)
+trends, trends_async = _service(_trends)
+filter_values, filter_values_async = _service(set_filter_values)
@@ -5,6 +5,36 @@ import polars.selectors as cs
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+# Columns aggregate_chart_data reads; chart scans project down to these
+CHART_COLUMNS = ['YEAR', 'Total_Spending', 'Total_Claims']
+
+# Chartable metrics. Per-unit metrics are re-derived as a ratio of summed
+# totals so they stay correct for any grouping.
+METRICS = {
+    'Total_Spending': {
+        'label': 'Gross Spending', 'numerator': 'Total_Spending', 'denominator': None, 'tickformat': '$.1f',
+    },
+    'Calc_Average_Spending_Per_Dosage_Unit': {
+        'label': 'Spending per Dosage Unit', 'numerator': 'Total_Spending', 'denominator': 'Total_Dosage_Units', 'tickformat': '$.2f',
+    },
+    'Calc_Average_Spending_Per_Claim': {
+        'label': 'Spending per Claim', 'numerator': 'Total_Spending', 'denominator': 'Total_Claims', 'tickformat': '$.2f',
+    },
+    'Calc_Average_Spending_Per_Beneficiary': {
+        'label': 'Spending per Beneficiary', 'numerator': 'Total_Spending', 'denominator': 'Total_Beneficiaries', 'tickformat': '$,.0f',
+    },
+}
+
+# Columns a chart can be split by; TOP_N_SPLITS keep the top N by spending and group the rest as "Other"
+SPLITS = {
+    'Brand_vs_Generic': 'Brand vs Generic',
+    'SPECIALTY_DRUG': 'Specialty Drug',
+    'Manufacturer': 'Manufacturer',
+}
+TOP_N_SPLITS = {'Manufacturer'}
+
+SERIES_COLORS = ['#1a365d', '#ed8936', '#38a169', '#805ad5', '#e53e3e', '#3182ce', '#d69e2e', '#718096']
+
 
 def aggregate_chart_data(data):
     """Aggregate data for chart visualization"""
@@ -23,12 +53,87 @@ def aggregate_chart_data(data):
         )
     )
 
-def create_partd_figure(dataframe):
+def metric_columns(metric, split=None):
+    """Columns aggregate_series reads for a metric and optional split"""
+    definition = METRICS[metric]
+    columns = ['YEAR', definition['numerator']]
+    if definition['denominator']:
+        columns.append(definition['denominator'])
+    if split:
+        columns.append(split)
+    if split in TOP_N_SPLITS and 'Total_Spending' not in columns:
+        columns.append('Total_Spending')
+    return columns
+
+
+def metric_expr(numerator, denominator=None):
+    """Aggregation expression for a summed total, or a ratio of summed totals"""
+    if not denominator:
+        return c(numerator).sum()
+    # Only count the numerator on rows that report the denominator
+    return c(numerator).filter(c(denominator).is_not_null()).sum() / c(denominator).sum()
+
+
+def split_expr(split, top_n=5):
+    """Series label expression for a split column"""
+    label = c(split).cast(pl.String)
+    if split == 'Brand_vs_Generic':
+        # The source mixes 'BRAND'/'Brand' and 'GENERIC'/'Generic'
+        label = label.replace({'BRAND': 'Brand', 'GENERIC': 'Generic'})
+    elif split == 'SPECIALTY_DRUG':
+        label = pl.when(c(split)).then(pl.lit('Specialty')).otherwise(pl.lit('Non-Specialty'))
+    if split in TOP_N_SPLITS:
+        # Rank groups by total spending inside the same plan so top-N needs no extra pass
+        rank = c.Total_Spending.sum().over(split).rank('dense', descending=True)
+        label = pl.when(rank <= top_n).then(label).otherwise(pl.lit('Other'))
+    return label.fill_null('Unknown')
+
+
+def aggregate_series(data, metric, split=None, top_n=5):
+    """
+    Aggregate a metric per year for every series in one grouped query
+    
+    Args:
+        data: Polars LazyFrame or DataFrame containing metric_columns(metric, split)
+        metric: Key of METRICS to plot
+        split: Optional key of SPLITS to break the metric into series
+        top_n: Number of series kept for TOP_N_SPLITS columns
+    
+    Returns:
+        Polars LazyFrame or DataFrame with columns 'year', 'series', 'value'
+    """
+    definition = METRICS[metric]
+    value = metric_expr(definition['numerator'], definition['denominator'])
+    series = split_expr(split, top_n) if split else pl.lit(definition['label'])
+
+    return (
+        data
+        .with_columns(series.alias('series'))
+        .group_by(['YEAR', 'series'])
+        .agg(value.alias('value'))
+        .select(c.YEAR.alias('year'), 'series', 'value')
+        .sort(['year', 'series'])
+    )
+
+
+def spending_scale(max_spending):
+    """Pick a display scale, unit suffix and axis label for a spending amount"""
+    if max_spending >= 1e9:
+        return 1e9, "B", "Gross Spending (Billions $)"
+    if max_spending >= 1e6:
+        return 1e6, "M", "Gross Spending (Millions $)"
+    if max_spending >= 1e3:
+        return 1e3, "K", "Gross Spending (Thousands $)"
+    return 1, "", "Gross Spending ($)"
+
+
+def create_partd_figure(dataframe, forecast=None):
     """
     Create a professional Part D spending dashboard chart inspired by 46brooklyn.com
     
     Args:
         dataframe: Polars DataFrame with columns 'year', 'total_spending', 'total_claims', 'per_claim'
+        forecast: Optional Polars DataFrame of projected years with columns 'year', 'total_spending', 'per_claim'
     
     Returns:
         plotly.graph_objects.Figure: Interactive chart showing spending trends
@@ -39,22 +144,9 @@ def create_partd_figure(dataframe):
     
     # Determine the best scale for gross spending
     max_spending = df_sorted['total_spending'].max()
-    if max_spending >= 1e9:
-        spending_scale = 1e9
-        spending_unit = "B"
-        spending_label = "Gross Spending (Billions $)"
-    elif max_spending >= 1e6:
-        spending_scale = 1e6
-        spending_unit = "M"
-        spending_label = "Gross Spending (Millions $)"
-    elif max_spending >= 1e3:
-        spending_scale = 1e3
-        spending_unit = "K"
-        spending_label = "Gross Spending (Thousands $)"
-    else:
-        spending_scale = 1
-        spending_unit = ""
-        spending_label = "Gross Spending ($)"
+    if forecast is not None and not forecast.is_empty():
+        max_spending = max(max_spending, forecast['total_spending'].max())
+    scale, spending_unit, spending_label = spending_scale(max_spending)
     
     # Create subplot with secondary y-axis
     fig = make_subplots(
@@ -66,7 +158,7 @@ def create_partd_figure(dataframe):
     fig.add_trace(
         go.Bar(
             x=df_sorted['year'].to_list(),
-            y=(df_sorted['total_spending'] / spending_scale).to_list(),
+            y=(df_sorted['total_spending'] / scale).to_list(),
             name="Gross Spending",
             marker_color='#1a365d',
             opacity=0.8,
@@ -93,6 +185,38 @@ def create_partd_figure(dataframe):
         secondary_y=True,
     )
     
+    # Add projected years, continuing the per claim line from the last actual year
+    if forecast is not None and not forecast.is_empty():
+        forecast = forecast.sort('year')
+        fig.add_trace(
+            go.Bar(
+                x=forecast['year'].to_list(),
+                y=(forecast['total_spending'] / scale).to_list(),
+                name="Projected Spending",
+                marker_color='#1a365d',
+                marker_pattern_shape='/',
+                opacity=0.35,
+                hovertemplate="<b>Year:</b> %{x}<br>" +
+                             f"<b>Projected Spending:</b> $%{{y:.1f}}{spending_unit}<br>" +
+                             "<extra></extra>"
+            ),
+            secondary_y=False,
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=[df_sorted['year'][-1]] + forecast['year'].to_list(),
+                y=[df_sorted['per_claim'][-1]] + forecast['per_claim'].to_list(),
+                mode='lines+markers',
+                name="Projected per Claim",
+                line=dict(color='#ed8936', width=3, dash='dash'),
+                marker=dict(size=8, color='#ed8936', symbol='circle-open'),
+                hovertemplate="<b>Year:</b> %{x}<br>" +
+                             "<b>Projected per Claim:</b> $%{y:.2f}<br>" +
+                             "<extra></extra>"
+            ),
+            secondary_y=True,
+        )
+    
     # Update x-axis
     fig.update_xaxes(
         title_text="Year",
@@ -182,6 +306,214 @@ def create_partd_figure(dataframe):
     
     return fig
 
+
+def create_metric_figure(dataframe, metric, split=None):
+    """
+    Create a multi-series line chart for one metric
+    
+    Args:
+        dataframe: Polars DataFrame from aggregate_series with columns 'year', 'series', 'value'
+        metric: Key of METRICS being plotted
+        split: Key of SPLITS the series were split by, if any
+    
+    Returns:
+        plotly.graph_objects.Figure: One line per series over the years
+    """
+    definition = METRICS[metric]
+    df_sorted = dataframe.sort(['series', 'year'])
+    
+    if metric == 'Total_Spending':
+        scale, unit, axis_label = spending_scale(df_sorted['value'].max())
+        value_format = f"$%{{y:.1f}}{unit}"
+    else:
+        scale, axis_label = 1, f"Average {definition['label']} ($)"
+        value_format = "$%{y:,.2f}"
+    
+    fig = go.Figure()
+    for i, ((series,), group) in enumerate(df_sorted.group_by(['series'], maintain_order=True)):
+        color = SERIES_COLORS[i % len(SERIES_COLORS)]
+        fig.add_trace(
+            go.Scatter(
+                x=group['year'].to_list(),
+                y=(group['value'] / scale).to_list(),
+                mode='lines+markers',
+                name=str(series),
+                line=dict(color=color, width=3),
+                marker=dict(size=8, color=color),
+                hovertemplate=f"<b>{series}:</b> {value_format}<extra></extra>",
+            )
+        )
+    
+    title = definition['label']
+    if split:
+        title = f"{title} by {SPLITS[split]}"
+    
+    fig.update_xaxes(
+        title_text="Year",
+        showgrid=True,
+        gridwidth=1,
+        gridcolor='lightgray',
+        title_font=dict(size=14, color='#2c3e50'),
+        tickfont=dict(size=12, color='#2c3e50'),
+        dtick=1,
+        showline=True,
+        linewidth=1,
+        linecolor='#e2e8f0',
+        mirror=True
+    )
+    fig.update_yaxes(
+        title_text=axis_label,
+        showgrid=True,
+        gridwidth=1,
+        gridcolor='lightgray',
+        title_font=dict(size=14, color='#1a365d'),
+        tickfont=dict(size=12, color='#1a365d'),
+        tickformat=definition['tickformat'],
+        showline=True,
+        linewidth=1,
+        linecolor='#e2e8f0',
+        mirror=True
+    )
+    fig.update_layout(
+        title=dict(
+            text=f"Medicare Part D {title}",
+            x=0.5,
+            font=dict(size=20, color='#1a365d', family='Source Sans Pro, Arial, sans-serif', weight='bold')
+        ),
+        plot_bgcolor='white',
+        paper_bgcolor='#f8fafc',
+        showlegend=True,
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="center",
+            x=0.5,
+            font=dict(size=12, color='#1a365d', family='Source Sans Pro, Arial, sans-serif'),
+            bgcolor="rgba(255,255,255,0.8)",
+            bordercolor="#e2e8f0",
+            borderwidth=1
+        ),
+        margin=dict(l=80, r=80, t=100, b=80),
+        height=600,
+        hovermode='x unified',
+        font=dict(family='Inter, Arial, sans-serif'),
+    )
+    fig.add_annotation(
+        text="Data Source: CMS Medicare Part D Drug Spending Dashboard",
+        xref="paper", yref="paper",
+        x=1, y=-0.12,
+        xanchor='right', yanchor='top',
+        font=dict(size=10, color='#718096', family='Inter, Arial, sans-serif'),
+        showarrow=False
+    )
+    
+    return fig
+
+def create_comparison_figure(dataframe):
+    """
+    Create an overlaid spending and spending per claim chart for compared cohorts
+    
+    Args:
+        dataframe: Polars DataFrame from compare_cohorts with columns 'year', 'cohort', 'total_spending', 'per_claim'
+    
+    Returns:
+        plotly.graph_objects.Figure: Grouped spending bars and per claim lines, one color per cohort
+    """
+    df_sorted = dataframe.sort(['cohort', 'year'])
+    scale, spending_unit, spending_label = spending_scale(df_sorted['total_spending'].max())
+    
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    for i, ((cohort,), group) in enumerate(df_sorted.group_by(['cohort'], maintain_order=True)):
+        color = SERIES_COLORS[i % len(SERIES_COLORS)]
+        fig.add_trace(
+            go.Bar(
+                x=group['year'].to_list(),
+                y=(group['total_spending'] / scale).to_list(),
+                name=f"{cohort} Spending",
+                marker_color=color,
+                opacity=0.7,
+                offsetgroup=str(i),
+                hovertemplate=f"<b>{cohort} Spending:</b> $%{{y:.1f}}{spending_unit}<extra></extra>",
+            ),
+            secondary_y=False,
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=group['year'].to_list(),
+                y=group['per_claim'].to_list(),
+                mode='lines+markers',
+                name=f"{cohort} per Claim",
+                line=dict(color=color, width=3),
+                marker=dict(size=8, color=color, symbol='diamond'),
+                hovertemplate=f"<b>{cohort} per Claim:</b> $%{{y:,.2f}}<extra></extra>",
+            ),
+            secondary_y=True,
+        )
+    
+    fig.update_xaxes(
+        title_text="Year",
+        showgrid=True,
+        gridwidth=1,
+        gridcolor='lightgray',
+        title_font=dict(size=14, color='#2c3e50'),
+        tickfont=dict(size=12, color='#2c3e50'),
+        dtick=1
+    )
+    fig.update_yaxes(
+        title_text=spending_label,
+        secondary_y=False,
+        showgrid=True,
+        gridwidth=1,
+        gridcolor='lightgray',
+        title_font=dict(size=14, color='#1a365d'),
+        tickfont=dict(size=12, color='#1a365d'),
+        tickformat='$.1f'
+    )
+    fig.update_yaxes(
+        title_text="Average Spending per Claim ($)",
+        secondary_y=True,
+        title_font=dict(size=14, color='#ed8936'),
+        tickfont=dict(size=12, color='#ed8936'),
+        tickformat='$.2f'
+    )
+    fig.update_layout(
+        title=dict(
+            text="Medicare Part D Cohort Comparison",
+            x=0.5,
+            font=dict(size=20, color='#1a365d', family='Source Sans Pro, Arial, sans-serif', weight='bold')
+        ),
+        barmode='group',
+        plot_bgcolor='white',
+        paper_bgcolor='#f8fafc',
+        showlegend=True,
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="center",
+            x=0.5,
+            font=dict(size=12, color='#1a365d', family='Source Sans Pro, Arial, sans-serif'),
+            bgcolor="rgba(255,255,255,0.8)",
+            bordercolor="#e2e8f0",
+            borderwidth=1
+        ),
+        margin=dict(l=80, r=80, t=100, b=80),
+        height=600,
+        hovermode='x unified',
+        font=dict(family='Inter, Arial, sans-serif'),
+    )
+    fig.add_annotation(
+        text="Data Source: CMS Medicare Part D Drug Spending Dashboard",
+        xref="paper", yref="paper",
+        x=1, y=-0.12,
+        xanchor='right', yanchor='top',
+        font=dict(size=10, color='#718096', family='Inter, Arial, sans-serif'),
+        showarrow=False
+    )
+    
+    return fig
+
 if __name__ == "__main__":
     pass
     # This will display the figure in a web browser
\ No newline at end of file
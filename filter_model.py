@@ -0,0 +1,142 @@
+"""
+Translate AG Grid filter models into Polars expressions.
+
+Lets the chart, export and other server-side paths evaluate the grid's
+current filters against the lazy dataset instead of the rows the browser
+sends back.
+"""
+
+import polars as pl
+from polars import col as c
+
+
+def _text_expr(column, condition):
+    """Build a case-insensitive text filter expression (AG Grid's default matching)"""
+    kind = condition.get("type", "contains")
+    value = condition.get("filter")
+    text = c(column).cast(pl.String)
+    if kind == "blank":
+        return text.is_null() | (text == "")
+    if kind == "notBlank":
+        return text.is_not_null() & (text != "")
+    # Boolean columns filtered with a text filter send "true"/"false" types without a value
+    if kind in ("true", "false"):
+        return c(column) == (kind == "true")
+    if value is None:
+        return pl.lit(True)
+    text = text.str.to_lowercase()
+    value = str(value).lower()
+    if kind == "contains":
+        return text.str.contains(value, literal=True)
+    if kind == "notContains":
+        # Blank cells do not contain the text, so they pass like in the grid
+        return ~text.str.contains(value, literal=True) | text.is_null()
+    if kind == "equals":
+        return text == value
+    if kind == "notEqual":
+        return (text != value) | text.is_null()
+    if kind == "startsWith":
+        return text.str.starts_with(value)
+    if kind == "endsWith":
+        return text.str.ends_with(value)
+    raise ValueError(f"Unsupported text filter type: {kind}")
+
+
+def _number_expr(column, condition):
+    """Build a numeric comparison filter expression"""
+    kind = condition.get("type", "equals")
+    value = condition.get("filter")
+    number = c(column).cast(pl.Float64, strict=False)
+    if kind == "blank":
+        return number.is_null()
+    if kind == "notBlank":
+        return number.is_not_null()
+    if value is None:
+        return pl.lit(True)
+    if kind == "equals":
+        return number == value
+    if kind == "notEqual":
+        return number != value
+    if kind == "greaterThan":
+        return number > value
+    if kind == "greaterThanOrEqual":
+        return number >= value
+    if kind == "lessThan":
+        return number < value
+    if kind == "lessThanOrEqual":
+        return number <= value
+    if kind == "inRange":
+        # AG Grid's inRange excludes both ends by default
+        return number.is_between(value, condition.get("filterTo", value), closed="none")
+    raise ValueError(f"Unsupported number filter type: {kind}")
+
+
+def _set_expr(column, condition):
+    """Build a set filter expression; AG Grid sends set values as string keys"""
+    values = condition.get("values") or []
+    keys = [str(v) for v in values if v is not None]
+    expr = c(column).cast(pl.String).is_in(keys)
+    if len(keys) < len(values):
+        expr = expr | c(column).is_null()
+    return expr
+
+
+def column_expr(column, condition):
+    """
+    Convert one column's filter model into a Polars expression.
+
+    Args:
+        column: Column (field) the filter applies to
+        condition: AG Grid filter model for that column
+
+    Returns:
+        polars.Expr: Boolean expression selecting the rows that pass
+
+    Raises:
+        ValueError: The filter model is malformed or uses an unsupported filter type
+    """
+    if not isinstance(condition, dict):
+        raise ValueError(f"Filter model for {column} must be an object")
+    filter_type = condition.get("filterType", "text")
+
+    # Combined conditions: {"operator": "AND", "conditions": [...]} or the older condition1/condition2 form
+    if "conditions" in condition or "condition1" in condition:
+        conditions = condition.get("conditions") or [condition["condition1"], condition["condition2"]]
+        exprs = [column_expr(column, {"filterType": filter_type, **sub}) for sub in conditions]
+        if condition.get("operator", "AND").upper() == "OR":
+            return pl.any_horizontal(exprs)
+        return pl.all_horizontal(exprs)
+
+    if filter_type == "multi":
+        exprs = [column_expr(column, sub) for sub in condition.get("filterModels") or [] if sub]
+        return pl.all_horizontal(exprs) if exprs else pl.lit(True)
+    if filter_type == "set":
+        return _set_expr(column, condition)
+    if filter_type == "number":
+        return _number_expr(column, condition)
+    if filter_type == "text":
+        return _text_expr(column, condition)
+    raise ValueError(f"Unsupported filter type: {filter_type}")
+
+
+def filter_expr(filter_model):
+    """
+    Convert a full AG Grid filter model into a single Polars expression.
+
+    Args:
+        filter_model: Mapping of column name to column filter model, as found
+            in the grid's filterModel property
+
+    Returns:
+        polars.Expr: Boolean expression combining every column filter with AND
+    """
+    if not filter_model:
+        return pl.lit(True)
+    if not isinstance(filter_model, dict):
+        raise ValueError("Filter model must be an object keyed by column")
+    return pl.all_horizontal([column_expr(column, condition) for column, condition in filter_model.items()])
+
+
+def filter_columns(filter_model):
+    """Return the columns referenced by a filter model"""
+    return list(filter_model or {})
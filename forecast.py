@@ -0,0 +1,163 @@
+"""
+Log-linear trend fitting and spending forecasts.
+
+Trends are fitted as ln(value) = intercept + slope * year by ordinary least
+squares. The closed-form solution (slope = cov(year, ln value) / var(year))
+is evaluated as grouped Polars aggregations, so fitting every drug is a
+single batched query rather than a loop over drugs.
+"""
+
+from functools import lru_cache
+
+import polars as pl
+from polars import col as c
+
+from helpers import data_version, load_data
+from incremental import Maintained, merge_sums
+from profiling import collect
+
+# Years of history a series needs before a trend is fitted
+MIN_YEARS = 3
+
+DRUG_TREND_COLUMNS = ['Generic_Name', 'YEAR', 'Total_Spending', 'Total_Dosage_Units']
+
+
+def fit_trends(data, metrics, by=None, year='year', min_years=MIN_YEARS):
+    """
+    Fit a log-linear trend to each metric, batched over every group
+
+    Args:
+        data: Polars LazyFrame or DataFrame with one row per group and year
+        metrics: Value columns to fit; non-positive values are ignored
+        by: Optional group column(s); each group gets its own fit
+        year: Name of the year column
+        min_years: Minimum number of positive observations for a fit
+
+    Returns:
+        Polars LazyFrame or DataFrame with '<metric>_slope', '<metric>_intercept'
+        and '<metric>_growth' (annual growth rate) per group
+    """
+    x = c(year).cast(pl.Float64)
+    aggregations = []
+    for metric in metrics:
+        valid = (c(metric) > 0) & c(metric).is_finite()
+        y = c(metric).log()
+        xv, yv = x.filter(valid), y.filter(valid)
+        slope = pl.cov(xv, yv) / xv.var()
+        aggregations += [
+            pl.when(valid.sum() >= min_years).then(slope).alias(f'{metric}_slope'),
+            pl.when(valid.sum() >= min_years).then(yv.mean() - slope * xv.mean()).alias(f'{metric}_intercept'),
+        ]
+
+    fits = data.group_by(by).agg(aggregations) if by else data.select(aggregations)
+    return fits.with_columns(
+        (c(f'{metric}_slope').exp() - 1).alias(f'{metric}_growth') for metric in metrics
+    )
+
+
+def project(fits, metrics, years, year='year'):
+    """
+    Evaluate fitted trends at the given years
+
+    Args:
+        fits: Output of fit_trends
+        metrics: Metrics to project
+        years: Years to project to
+        year: Name of the year column in the result
+
+    Returns:
+        Polars DataFrame with one row per group and year holding projected metric values
+    """
+    return (
+        fits.lazy()
+        .join(pl.LazyFrame({year: list(years)}), how='cross')
+        .with_columns(
+            (c(f'{metric}_intercept') + c(f'{metric}_slope') * c(year)).exp().alias(metric)
+            for metric in metrics
+        )
+        .drop(fit_columns(metrics))
+        .collect()
+    )
+
+
+def fit_columns(metrics):
+    """Names of the fit columns fit_trends adds for the given metrics"""
+    return [f'{metric}_{suffix}' for metric in metrics for suffix in ('slope', 'intercept', 'growth')]
+
+
+def forecast_chart_data(dataframe, horizon=1):
+    """
+    Project the aggregate chart series forward
+
+    Args:
+        dataframe: Polars DataFrame from aggregate_chart_data
+        horizon: Number of years past the last actual year to project
+
+    Returns:
+        Polars DataFrame with columns 'year', 'total_spending', 'per_claim',
+        empty when there is too little history to fit a trend
+    """
+    metrics = ['total_spending', 'per_claim']
+    fits = fit_trends(dataframe.select('year', *metrics), metrics)
+    if fits.select(pl.all_horizontal(c(f'{m}_slope').is_null() for m in metrics)).item():
+        return pl.DataFrame(schema={'year': pl.Int64, 'total_spending': pl.Float64, 'per_claim': pl.Float64})
+
+    last_year = dataframe['year'].max()
+    years = range(last_year + 1, last_year + 1 + horizon)
+    return project(fits, metrics, years).select('year', *metrics)
+
+
+def drug_yearly_totals(data):
+    """Per drug and year spending sums; spending per dosage unit is derived from these"""
+    return (
+        data
+        .group_by(['Generic_Name', 'YEAR'])
+        .agg(
+            c.Total_Spending.sum().alias('spending'),
+            c.Total_Spending.filter(c.Total_Dosage_Units.is_not_null()).sum().alias('unit_spending'),
+            c.Total_Dosage_Units.sum().alias('units'),
+        )
+    )
+
+
+def drug_yearly_metrics(totals):
+    """Per drug and year spending and spending per dosage unit from drug_yearly_totals"""
+    return totals.select(
+        'Generic_Name',
+        c.YEAR.alias('year'),
+        'spending',
+        (c.unit_spending / c.units).alias('per_unit'),
+    )
+
+
+def _drug_totals(files):
+    """drug_yearly_totals of the given data files"""
+    return collect(drug_yearly_totals(load_data(DRUG_TREND_COLUMNS, files)), "drug_yearly_totals")
+
+
+# YEAR-keyed drug rollup; a new year only adds its own (drug, year) rows
+drug_totals = Maintained(
+    "drug_yearly_totals",
+    build=_drug_totals,
+    extend=lambda totals, files: merge_sums(totals, _drug_totals(files), ['Generic_Name', 'YEAR']),
+)
+
+
+@lru_cache(maxsize=4)
+def _drug_trends(version):
+    """Per drug trend fits from the maintained yearly rollup, cached per data version"""
+    return collect(
+        fit_trends(drug_yearly_metrics(drug_totals.get().lazy()), ['spending', 'per_unit'], by='Generic_Name'),
+        "drug_trends",
+    )
+
+
+def drug_trends():
+    """
+    Fitted spending and $/unit trends for every drug
+
+    Returns:
+        Polars DataFrame keyed by 'Generic_Name' with slope, intercept and
+        annual growth for 'spending' and 'per_unit'
+    """
+    return _drug_trends(data_version())
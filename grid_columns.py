@@ -0,0 +1,63 @@
+"""
+Grid column definitions and row loading, without UI dependencies.
+
+Shared by the AG Grid component and the data service, so API and worker
+processes can import the dataset's columns without building the grid.
+"""
+
+import os
+
+import polars as pl
+
+from helpers import load_data
+from profiling import collect
+from set_filters import SET_FILTER_COLUMNS
+
+# Set filters are an AG Grid Enterprise feature; they are enabled when a license key is configured
+AG_GRID_LICENSE_KEY = os.environ.get("AG_GRID_LICENSE_KEY")
+
+
+# Column definitions with proper naming and formatting
+columnDefs = [
+    {"field": "Product_Name", "headerName": "Product Name", "filter": True, "minWidth": 200},
+    {"field": "Generic_Name", "headerName": "Generic Name", "filter": True, "minWidth": 180},
+    {"field": "Manufacturer", "headerName": "Manufacturer", "filter": True, "minWidth": 150},
+    {"field": "Total_Spending", "headerName": "Total Spending", "type": "rightAligned", "valueFormatter": {"function": "d3.format('$,.0f')(params.value)"}, "filter": True, "minWidth": 130},
+    {"field": "Total_Dosage_Units", "headerName": "Dosage Units", "hide": True, "type": "rightAligned", "valueFormatter": {"function": "d3.format(',')(params.value)"}, "filter": True, "minWidth": 120},
+    {"field": "Total_Claims", "headerName": "Total Claims", "type": "rightAligned", "valueFormatter": {"function": "d3.format(',')(params.value)"}, "filter": True, "minWidth": 120},
+    {"field": "Total_Beneficiaries", "headerName": "Beneficiaries", "hide": True, "type": "rightAligned", "valueFormatter": {"function": "d3.format(',')(params.value)"}, "filter": True, "minWidth": 120},
+    {"field": "Calc_Average_Spending_Per_Dosage_Unit", "headerName": "$/Unit", "type": "rightAligned", "valueFormatter": {"function": "d3.format('$,.2f')(params.value)"}, "filter": True, "minWidth": 100},
+    {"field": "Calc_Average_Spending_Per_Claim", "headerName": "$/Claim", "type": "rightAligned", "valueFormatter": {"function": "d3.format('$,.2f')(params.value)"}, "filter": True, "minWidth": 100},
+    {"field": "Calc_Average_Spending_Per_Beneficiary", "headerName": "$/Beneficiary", "type": "rightAligned", "valueFormatter": {"function": "d3.format('$,.0f')(params.value)"}, "filter": True, "minWidth": 130},
+    {"field": "Outlier_Flag", "headerName": "Outlier", "filter": True, "minWidth": 80},
+    {"field": "YEAR", "headerName": "Year", "filter": True, "minWidth": 80},
+    {"field": "Brand_vs_Generic", "headerName": "Type", "filter": True, "minWidth": 100},
+    {"field": "SPECIALTY_DRUG", "headerName": "Specialty", "filter": True, "minWidth": 100},
+]
+
+# Enterprise set filters fetch their value lists from the server instead of scanning every row in the browser
+if AG_GRID_LICENSE_KEY:
+    for col_def in columnDefs:
+        if col_def["field"] in SET_FILTER_COLUMNS:
+            col_def["filter"] = "agSetColumnFilter"
+            col_def["filterParams"] = {
+                "values": {"function": "partdSetFilterValues(params)"},
+                "refreshValuesOnOpen": True,
+            }
+
+
+# Dataset columns exposed to API consumers
+COLUMNS = [col_def["field"] for col_def in columnDefs]
+
+
+def visible_fields(column_defs):
+    """Return the fields of the columns that are not hidden, in display order"""
+    return [col_def["field"] for col_def in column_defs if not col_def.get("hide")]
+
+
+def load_grid_rows(fields, outlier_flags=None):
+    """Load grid rows holding only the given fields, with recomputed outlier flags if given"""
+    data = load_data(fields)
+    if outlier_flags is not None and "Outlier_Flag" in fields:
+        data = data.with_columns(pl.lit(outlier_flags))
+    return collect(data, "grid_rows", filters={"columns": fields}).to_dicts()
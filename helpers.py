@@ -1,13 +1,67 @@
 import polars as pl
 from polars import col as c
 import polars.selectors as cs
+import os
 from pathlib import Path
+from filter_model import filter_expr
 
-def load_data():
-    data_path = Path(__file__).parent / "data" / "partd.parquet"
-    if not data_path.exists():
-        raise FileNotFoundError(f"Data file not found: {data_path}")
-    return pl.scan_parquet(data_path)
+# PARTD_DATA_PATH points the dashboard at another file with the same schema, e.g. from synthetic.py
+DATA_PATH = Path(os.environ.get("PARTD_DATA_PATH", Path(__file__).parent / "data" / "partd.parquet"))
+# Each CMS release appends a YEAR as its own file here (see incremental.py)
+APPEND_DIR = Path(os.environ.get("PARTD_APPEND_DIR", DATA_PATH.parent / f"{DATA_PATH.stem}_appends"))
+
+
+def data_files():
+    """The base data file followed by appended files, in row order"""
+    return [DATA_PATH] + sorted(APPEND_DIR.glob("*.parquet"))
+
+
+def file_versions(files=None):
+    """(path, size-mtime) of each data file; a prefix match means rows were only appended"""
+    versions = []
+    for path in files or data_files():
+        stat = path.stat()
+        versions.append((str(path), f"{stat.st_size}-{stat.st_mtime_ns}"))
+    return tuple(versions)
+
+
+def data_version():
+    """Identify the current data file contents; caches are keyed by this"""
+    return "+".join(version for _, version in file_versions())
+
+
+def load_data(columns=None, files=None):
+    """
+    Scan the Part D dataset, projecting down to `columns` when given
+
+    `files` restricts the scan to some data files, e.g. only appended ones.
+    """
+    files = files or data_files()
+    missing = [path for path in files if not path.exists()]
+    if missing:
+        raise FileNotFoundError(f"Data file not found: {missing[0]}")
+    data = pl.scan_parquet(files)
+    if columns:
+        data = data.select(columns)
+    return data
+
+
+def query_data(filter_model=None, columns=None, outlier_flags=None):
+    """
+    Scan the dataset with an AG Grid filter model applied.
+
+    The filter is applied before projecting, so filter columns are read but
+    only `columns` are returned. `outlier_flags` (from outliers.outlier_flags_for)
+    replaces the precomputed Outlier_Flag before filtering.
+    """
+    data = load_data()
+    if outlier_flags is not None:
+        data = data.with_columns(pl.lit(outlier_flags))
+    if filter_model:
+        data = data.filter(filter_expr(filter_model))
+    if columns:
+        data = data.select(columns)
+    return data
 
 
 if __name__ == "__main__":
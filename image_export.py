@@ -0,0 +1,236 @@
+"""
+Server-side chart image export.
+
+Renders the dashboard's spending chart (create_partd_figure) to PNG, SVG or
+PDF with Plotly's Kaleido engine, so reports can be generated without a
+browser session per chart. Report views are rendered together in one
+Kaleido call. Rendered bytes are cached per data version, filter model and
+image options.
+
+    python image_export.py build/charts --format png
+
+writes the standard views (overall, brand, generic, specialty) to files.
+Kaleido also needs a Chrome install (`plotly_get_chrome`).
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+import plotly.io as pio
+
+import data_service
+from comparison import COHORT_PRESETS
+from figure import create_partd_figure
+from forecast import forecast_chart_data
+from query import QueryCache
+
+IMAGE_FORMATS = {"png": "image/png", "svg": "image/svg+xml", "pdf": "application/pdf"}
+DEFAULT_WIDTH = 1200
+DEFAULT_HEIGHT = 600
+DEFAULT_SCALE = 2
+# Largest rendered edge in pixels (width or height times scale)
+MAX_PIXELS = 4000
+
+# Report views rendered by render_views; each is a title suffix and filter model
+STANDARD_VIEWS = {
+    "overall": (None, {}),
+    "brand": COHORT_PRESETS["brand"],
+    "generic": COHORT_PRESETS["generic"],
+    "specialty": COHORT_PRESETS["specialty"],
+}
+
+# Each render drives a headless Chrome, so only a few run at once
+RENDER_WORKERS = int(os.environ.get("PARTD_RENDER_WORKERS", 2))
+_render_slots = threading.BoundedSemaphore(RENDER_WORKERS)
+
+images = QueryCache(
+    max_entries=int(os.environ.get("PARTD_IMAGE_CACHE_SIZE", 256)),
+    max_bytes=float(os.environ.get("PARTD_IMAGE_CACHE_MB", 64)) * 1024 * 1024,
+)
+
+
+class ImageExportUnavailable(RuntimeError):
+    """Raised when Kaleido (or the Chrome it drives) is not available to render images"""
+
+
+def chart_figure(filter_model=None, outlier_params=None, forecast=False, label=None):
+    """
+    The dashboard's spending chart for a filter model
+
+    Args:
+        filter_model: AG Grid filter model
+        outlier_params: The dashboard's outlier settings
+        forecast: Include the projected year
+        label: Appended to the chart title, e.g. a view name
+
+    Returns:
+        plotly.graph_objects.Figure
+    """
+    data = data_service.aggregate(filter_model, "overview", None, outlier_params)
+    if data.is_empty():
+        raise ValueError("No rows match the filter model")
+    figure = create_partd_figure(data, forecast_chart_data(data) if forecast else None)
+    if label:
+        figure.update_layout(title_text=f"{figure.layout.title.text}: {label}")
+    return figure
+
+
+def _check_render(fmt):
+    """Raise unless `fmt` is known and Kaleido is installed"""
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format: {fmt}. Formats: {', '.join(IMAGE_FORMATS)}")
+    try:
+        import kaleido  # noqa: F401
+    except ImportError as e:
+        raise ImageExportUnavailable("Image export needs kaleido: pip install kaleido") from e
+
+
+def render_figure(figure, fmt="png", width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, scale=DEFAULT_SCALE):
+    """
+    Render a figure to image bytes with Kaleido
+
+    Raises:
+        ImageExportUnavailable: Kaleido is not installed or cannot start Chrome
+    """
+    _check_render(fmt)
+    with _render_slots:
+        try:
+            return figure.to_image(format=fmt, width=width, height=height, scale=scale)
+        except RuntimeError as e:
+            raise ImageExportUnavailable(f"Chart rendering failed: {e}") from e
+
+
+def render_figures(figures, fmt="png", width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, scale=DEFAULT_SCALE):
+    """
+    Render several figures to image bytes in one Kaleido call
+
+    plotly.io.write_images (Kaleido 1.0 or later) starts Chrome once for the
+    whole batch; it only writes to files, so images go through a temporary
+    directory.
+
+    Returns:
+        list: Image bytes in the order of `figures`
+
+    Raises:
+        ImageExportUnavailable: Kaleido is not installed or cannot start Chrome
+    """
+    _check_render(fmt)
+    with _render_slots, tempfile.TemporaryDirectory() as tmp:
+        paths = [Path(tmp) / f"{n}.{fmt}" for n in range(len(figures))]
+        try:
+            pio.write_images(figures, paths, format=fmt, width=width, height=height, scale=scale)
+        except RuntimeError as e:
+            raise ImageExportUnavailable(f"Chart rendering failed: {e}") from e
+        return [path.read_bytes() for path in paths]
+
+
+def _image_options(fmt, width, height, scale):
+    """Validated image options"""
+    width, height, scale = int(width), int(height), float(scale)
+    if not (width > 0 and height > 0 and 0 < scale <= 4):
+        raise ValueError("width and height must be positive and scale between 0 and 4")
+    if max(width, height) * scale > MAX_PIXELS:
+        raise ValueError(f"width and height times scale must be at most {MAX_PIXELS} pixels")
+    return fmt, width, height, scale
+
+
+def _image_key(filter_model, outlier_params, forecast, label, options):
+    """Cache key of a rendered chart"""
+    return images.key([filter_model or {}, outlier_params, bool(forecast), label, *options])
+
+
+def chart_image(filter_model=None, outlier_params=None, forecast=False, label=None, fmt="png",
+                width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, scale=DEFAULT_SCALE):
+    """
+    The spending chart for a filter model as image bytes, cached per data version
+
+    Returns:
+        tuple: (cache key, image bytes)
+    """
+    options = _image_options(fmt, width, height, scale)
+    key = _image_key(filter_model, outlier_params, forecast, label, options)
+    image = images.get(key)
+    if image is None:
+        image = render_figure(chart_figure(filter_model, outlier_params, forecast, label), *options)
+        images.put(key, image)
+    return key, image
+
+
+def render_views(views=None, fmt="png", forecast=False, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT,
+                 scale=DEFAULT_SCALE):
+    """
+    Render standard report views
+
+    Views missing from the image cache are rendered together with
+    render_figures, then cached one by one.
+
+    Args:
+        views: Keys of STANDARD_VIEWS (all when None)
+        fmt: Image format
+        forecast: Include the projected year
+        width, height, scale: Image size, as for chart_image
+
+    Returns:
+        dict: View name to image bytes
+    """
+    names = list(views or STANDARD_VIEWS)
+    for name in names:
+        if name not in STANDARD_VIEWS:
+            raise ValueError(f"Unknown view: {name}. Views: {', '.join(STANDARD_VIEWS)}")
+    options = _image_options(fmt, width, height, scale)
+    rendered, pending = {}, {}
+    for name in names:
+        label, filter_model = STANDARD_VIEWS[name]
+        key = _image_key(filter_model, None, forecast, label, options)
+        image = images.get(key)
+        if image is None:
+            pending[name] = key
+        else:
+            rendered[name] = image
+    if pending:
+        figures = [
+            chart_figure(STANDARD_VIEWS[name][1], forecast=forecast, label=STANDARD_VIEWS[name][0])
+            for name in pending
+        ]
+        for (name, key), image in zip(pending.items(), render_figures(figures, *options)):
+            images.put(key, image)
+            rendered[name] = image
+    return {name: rendered[name] for name in names}
+
+
+def write_views(output_dir, fmt="png", views=None, **options):
+    """Write standard views to `output_dir` as partd_<view>.<fmt>, returning the paths"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for name, image in render_views(views, fmt, **options).items():
+        path = output_dir / f"partd_{name}.{fmt}"
+        path.write_bytes(image)
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the standard dashboard chart views to image files")
+    parser.add_argument("output_dir")
+    parser.add_argument("--format", choices=list(IMAGE_FORMATS), default="png")
+    parser.add_argument("--views", nargs="+", choices=list(STANDARD_VIEWS))
+    parser.add_argument("--width", type=int, default=DEFAULT_WIDTH)
+    parser.add_argument("--height", type=int, default=DEFAULT_HEIGHT)
+    parser.add_argument("--scale", type=float, default=DEFAULT_SCALE)
+    parser.add_argument("--forecast", action="store_true", help="Include the projected year")
+    args = parser.parse_args()
+
+    try:
+        paths = write_views(
+            args.output_dir, args.format, args.views,
+            width=args.width, height=args.height, scale=args.scale, forecast=args.forecast,
+        )
+    except ImageExportUnavailable as e:
+        sys.exit(str(e))
+    for path in paths:
+        print(f"Wrote {path}")
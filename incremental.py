@@ -0,0 +1,182 @@
+"""
+Incremental refresh when a CMS release appends a YEAR of data.
+
+A new year is written as its own parquet file under helpers.APPEND_DIR
+instead of rewriting data/partd.parquet. When the data files change only by
+appended files, each Maintained structure (the in-memory dataset and its
+bitmap index, YEAR-keyed rollups, set filter value lists and the search
+index) is extended from the appended rows alone rather than rebuilt from
+the full dataset.
+
+    python incremental.py append data/partd_2024.parquet --verify
+    python incremental.py verify
+
+Verification rebuilds every structure from scratch and compares it with
+the incrementally extended one.
+"""
+
+import argparse
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+
+import polars as pl
+from polars import col as c
+from polars.testing import assert_frame_equal
+
+from helpers import APPEND_DIR, DATA_PATH, data_files, file_versions, load_data
+
+# Every Maintained structure by name, in creation order
+REGISTRY = {}
+
+
+def assert_rollup_equal(left, right):
+    """Compare rollups regardless of row order; summation order may shift float sums slightly"""
+    assert_frame_equal(left, right, check_row_order=False, rel_tol=1e-9)
+
+
+class Maintained:
+    """
+    A structure derived from the data files, extended in place when files are appended
+
+    Args:
+        name: Registry name
+        build: build(files) -> value computed from the given data files
+        extend: extend(value, appended_files) -> value covering the old and
+            appended files; without it any change triggers a full rebuild
+        compare: compare(extended, rebuilt) raising AssertionError on mismatch
+    """
+
+    def __init__(self, name, build, extend=None, compare=assert_rollup_equal):
+        self.name = name
+        self.build = build
+        self.extend = extend
+        self.compare = compare
+        self._files = None
+        self._value = None
+        self._lock = threading.Lock()
+        REGISTRY[name] = self
+
+    def _appended(self, files):
+        """Files appended since the value was built, or None if anything else changed"""
+        if self._files is None or self.extend is None or files[:len(self._files)] != self._files:
+            return None
+        return [Path(path) for path, _ in files[len(self._files):]]
+
+    def get(self):
+        """The value for the current data files, extending or rebuilding it as needed"""
+        files = file_versions()
+        with self._lock:
+            if files != self._files:
+                appended = self._appended(files)
+                if appended:
+                    self._value = self.extend(self._value, appended)
+                else:
+                    self._value = self.build(data_files())
+                self._files = files
+            return self._value
+
+    def verify(self, files=None):
+        """
+        Extend from the base file through each appended file and compare with a full rebuild
+
+        Raises:
+            AssertionError: The extended and rebuilt values differ
+        """
+        if self.extend is None:
+            return
+        files = files or data_files()
+        value = self.build(files[:1])
+        for path in files[1:]:
+            value = self.extend(value, [path])
+        self.compare(value, self.build(files))
+
+
+def merge_sums(rollup, delta, keys):
+    """Add a delta rollup into a rollup of summed columns keyed by `keys`"""
+    return (
+        pl.concat([rollup, delta])
+        .group_by(keys)
+        .agg(pl.all().sum())
+        .sort(keys, nulls_last=True)
+    )
+
+
+def append_year(path):
+    """
+    Validate a release's rows against the dataset and add them as an appended file
+
+    Args:
+        path: Parquet file holding one or more new YEARs with the dataset's schema
+
+    Returns:
+        pathlib.Path: The appended file
+    """
+    schema = pl.scan_parquet(DATA_PATH).collect_schema()
+    new_schema = pl.scan_parquet(path).collect_schema()
+    if new_schema != schema:
+        raise ValueError(f"{path} does not match the schema of {DATA_PATH}")
+
+    years = pl.scan_parquet(path).select(c.YEAR.unique().sort()).collect().to_series().to_list()
+    existing = set(load_data(["YEAR"]).unique().collect().to_series().to_list())
+    if not years or existing & set(years):
+        raise ValueError(f"{path} must only hold new years; already loaded: {sorted(existing & set(years))}")
+
+    APPEND_DIR.mkdir(parents=True, exist_ok=True)
+    target = APPEND_DIR / f"{DATA_PATH.stem}_{'_'.join(map(str, years))}.parquet"
+    shutil.copyfile(path, target)
+    return target
+
+
+def refresh():
+    """Bring every Maintained structure up to date, returning seconds spent per structure"""
+    timings = {}
+    for name, maintained in REGISTRY.items():
+        start = time.perf_counter()
+        maintained.get()
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def verify():
+    """Compare every Maintained structure built incrementally against a full rebuild"""
+    failures = {}
+    for name, maintained in REGISTRY.items():
+        try:
+            maintained.verify()
+        except AssertionError as e:
+            failures[name] = str(e)
+    return failures
+
+
+if __name__ == "__main__":
+    # Structures register with the imported `incremental` module, not this __main__ copy
+    import data_service  # noqa: F401
+    import forecast  # noqa: F401
+    import incremental
+    import session_cache  # noqa: F401
+    import set_filters  # noqa: F401
+
+    parser = argparse.ArgumentParser(description="Append a CMS release year and refresh derived data incrementally")
+    commands = parser.add_subparsers(dest="command", required=True)
+    append = commands.add_parser("append", help="Append a parquet file of new years")
+    append.add_argument("path")
+    append.add_argument("--verify", action="store_true", help="Compare against a full rebuild afterwards")
+    commands.add_parser("verify", help="Compare incremental and full builds for the current files")
+    args = parser.parse_args()
+
+    if args.command == "append":
+        incremental.refresh()
+        target = incremental.append_year(args.path)
+        print(f"Appended {args.path} as {target}")
+        for name, seconds in incremental.refresh().items():
+            print(f"  {name:<20} {seconds * 1000:8.1f} ms")
+    if args.command == "verify" or args.verify:
+        failures = incremental.verify()
+        for name in incremental.REGISTRY:
+            print(f"  {name:<20} {'MISMATCH' if name in failures else 'ok'}")
+        for name, message in failures.items():
+            print(f"\n{name}:\n{message}", file=sys.stderr)
+        sys.exit(1 if failures else 0)
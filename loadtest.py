@@ -0,0 +1,351 @@
+"""
+Concurrent load test harness for the dashboard's Dash callbacks.
+
+Replays grid filter sessions against the `_dash-update-component` endpoint
+with a configurable number of concurrent users, then reports p50/p95/p99
+latency, throughput and the memory of the server's worker processes.
+
+Sessions come from a JSON file of recorded interactions (see
+DEFAULT_SESSIONS for the format) or from a browser HAR export, whose
+`_dash-update-component` requests are replayed verbatim. Runs fully
+offline, optionally starting a local gunicorn instance:
+
+    python loadtest.py --start-gunicorn --workers 4 --users 32 --duration 60
+    python loadtest.py --url http://127.0.0.1:8050 --sessions session.har
+"""
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Each session is a list of steps a user performs in order. "chart" steps
+# replay update_fig with the grid's filter model and chart controls
+# ("compare" holds two cohort keys for comparison mode), "download" steps
+# replay download_csv.
+DEFAULT_SESSIONS = [
+    [
+        {"action": "chart", "filterModel": {}},
+        {"action": "chart", "filterModel": {"Brand_vs_Generic": {"filterType": "text", "type": "contains", "filter": "generic"}}},
+        {"action": "chart", "filterModel": {"Brand_vs_Generic": {"filterType": "text", "type": "contains", "filter": "generic"}}, "split": "SPECIALTY_DRUG"},
+        {"action": "chart", "filterModel": {"YEAR": {"filterType": "number", "type": "greaterThan", "filter": 2019}}, "compare": ["specialty", "non_specialty"]},
+        {"action": "download", "filterModel": {"Brand_vs_Generic": {"filterType": "text", "type": "contains", "filter": "generic"}}},
+    ],
+    [
+        {"action": "chart", "filterModel": {"Manufacturer": {"filterType": "text", "type": "contains", "filter": "pfizer"}}},
+        {"action": "chart", "filterModel": {"Manufacturer": {"filterType": "text", "type": "contains", "filter": "pfizer"}}, "metric": "Calc_Average_Spending_Per_Dosage_Unit"},
+        {"action": "chart", "filterModel": {"YEAR": {"filterType": "text", "type": "equals", "filter": "2023"}}, "split": "Manufacturer"},
+    ],
+    [
+        {"action": "chart", "filterModel": {"Generic_Name": {"filterType": "text", "type": "startsWith", "filter": "insulin"}}, "forecast": True},
+        {"action": "chart", "filterModel": {"Total_Spending": {"filterType": "number", "type": "greaterThan", "filter": 1000000}}},
+        {"action": "download", "filterModel": {"Total_Spending": {"filterType": "number", "type": "greaterThan", "filter": 1000000}}},
+    ],
+]
+
+DEFAULT_COLUMNS = [
+    "Product_Name", "Generic_Name", "Manufacturer", "Total_Spending", "Total_Claims",
+    "Calc_Average_Spending_Per_Dosage_Unit", "Calc_Average_Spending_Per_Claim",
+    "Calc_Average_Spending_Per_Beneficiary", "Outlier_Flag", "YEAR", "Brand_vs_Generic", "SPECIALTY_DRUG",
+]
+
+
+def chart_payload(step):
+    """Dash callback request body for update_fig"""
+    return {
+        "output": "..fig.figure...comparison-table.children..",
+        "outputs": [{"id": "fig", "property": "figure"}, {"id": "comparison-table", "property": "children"}],
+        "inputs": [
+            {"id": "ag-grid", "property": "filterModel", "value": step.get("filterModel") or {}},
+            {"id": "chart-metric", "property": "value", "value": step.get("metric", "overview")},
+            {"id": "chart-split", "property": "value", "value": step.get("split")},
+            {"id": "chart-forecast", "property": "checked", "value": step.get("forecast", False)},
+            {"id": "outlier-params", "property": "data", "value": step.get("outliers")},
+            {"id": "compare-mode", "property": "checked", "value": "compare" in step},
+            {"id": "cohort-a", "property": "value", "value": step.get("compare", ["brand", "generic"])[0]},
+            {"id": "cohort-b", "property": "value", "value": step.get("compare", ["brand", "generic"])[1]},
+        ],
+        "changedPropIds": ["ag-grid.filterModel"],
+        "state": [
+            {"id": "session-id", "property": "data", "value": step.get("session")},
+            {"id": "snapshot-version", "property": "data", "value": None},
+        ],
+    }
+
+
+def download_payload(step):
+    """Dash callback request body for download_csv"""
+    return {
+        "output": "..download-csv.data...export-location.href..",
+        "outputs": [{"id": "download-csv", "property": "data"}, {"id": "export-location", "property": "href"}],
+        "inputs": [{"id": "download-button", "property": "n_clicks", "value": 1}],
+        "changedPropIds": ["download-button.n_clicks"],
+        "state": [
+            {"id": "ag-grid", "property": "filterModel", "value": step.get("filterModel") or {}},
+            {"id": "column-picker", "property": "value", "value": step.get("columns", DEFAULT_COLUMNS)},
+            {"id": "outlier-params", "property": "data", "value": step.get("outliers")},
+            {"id": "session-id", "property": "data", "value": step.get("session")},
+        ],
+    }
+
+
+STEP_PAYLOADS = {"chart": chart_payload, "download": download_payload}
+
+
+def load_sessions(path):
+    """
+    Load sessions as lists of (label, request body) pairs
+
+    Args:
+        path: JSON sessions file, HAR export, or None for DEFAULT_SESSIONS
+    """
+    if path is None:
+        raw = DEFAULT_SESSIONS
+    else:
+        raw = json.loads(Path(path).read_text(encoding="utf-8"))
+
+    # HAR export: replay every recorded callback request as one session
+    if isinstance(raw, dict) and "log" in raw:
+        session = []
+        for entry in raw["log"]["entries"]:
+            req = entry["request"]
+            if req["method"] == "POST" and req["url"].endswith("_dash-update-component"):
+                body = json.loads(req["postData"]["text"])
+                session.append((body.get("output", "callback"), body))
+        if not session:
+            raise ValueError(f"No _dash-update-component requests found in {path}")
+        return [session]
+
+    return [
+        [(step["action"], STEP_PAYLOADS[step["action"]](step)) for step in session]
+        for session in raw
+    ]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def process_tree_rss(pid):
+    """Resident memory in MB of a process and its children, keyed by pid (Linux /proc)"""
+    rss = {}
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            status = Path(f"/proc/{current}/status").read_text()
+            for line in status.splitlines():
+                if line.startswith("VmRSS:"):
+                    rss[current] = int(line.split()[1]) / 1024
+            for task in Path(f"/proc/{current}/task").iterdir():
+                children = (task / "children").read_text().split()
+                pending.extend(int(child) for child in children)
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            continue
+    return rss
+
+
+class MemorySampler(threading.Thread):
+    """Samples server process memory in the background, keeping per-process peaks"""
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            for pid, mb in process_tree_rss(self.pid).items():
+                self.peak[pid] = max(self.peak.get(pid, 0), mb)
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def post(url, body, timeout):
+    """POST a callback request, returning (status, latency seconds, response bytes)"""
+    data = json.dumps(body).encode("utf-8")
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            payload = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        payload, status = e.read(), e.code
+    except (urllib.error.URLError, TimeoutError, ConnectionError):
+        payload, status = b"", 0
+    return status, time.perf_counter() - start, len(payload)
+
+
+def with_session(body, session_id):
+    """A copy of a callback request body with its session-id state set to `session_id`"""
+    state = [
+        {**item, "value": session_id} if item.get("id") == "session-id" else item
+        for item in body.get("state", [])
+    ]
+    return {**body, "state": state}
+
+
+def run_load(base_url, sessions, users, duration=None, iterations=1, timeout=60):
+    """
+    Replay sessions with `users` concurrent virtual users
+
+    Each user replays sessions round-robin, starting at a different session,
+    until `duration` seconds pass or, without a duration, `iterations`
+    sessions have been completed. Every user has its own browser session id,
+    so server-side selection caches are exercised per user as in production.
+
+    Returns:
+        dict: Latencies and statuses per callback label, plus wall time
+    """
+    url = base_url.rstrip("/") + "/_dash-update-component"
+    results = defaultdict(list)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration if duration else None
+
+    def user(index):
+        session_id = uuid.uuid4().hex
+        completed = 0
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            if deadline is None and completed >= iterations:
+                return
+            for label, body in sessions[(index + completed) % len(sessions)]:
+                status, latency, size = post(url, with_session(body, session_id), timeout)
+                with lock:
+                    results[label].append((status, latency, size))
+            completed += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(user, range(users)))
+    return {"results": dict(results), "wall_time": time.perf_counter() - start}
+
+
+def summarize(run, memory=None):
+    """
+    Build the report: latency percentiles (ms), throughput and errors per callback and overall
+
+    Any 2xx response is a success; 204 (a callback raising PreventUpdate) is
+    counted in the percentiles and also reported as no_update.
+    """
+    def stats(samples):
+        latencies = [latency * 1000 for status, latency, size in samples if 200 <= status < 300]
+        return {
+            "requests": len(samples),
+            "errors": len(samples) - len(latencies),
+            "no_update": sum(1 for status, latency, size in samples if status == 204),
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "throughput_rps": len(samples) / run["wall_time"] if run["wall_time"] else None,
+            "mean_response_kb": sum(size for _, _, size in samples) / len(samples) / 1024 if samples else None,
+        }
+
+    everything = [sample for samples in run["results"].values() for sample in samples]
+    report = {
+        "wall_time_s": run["wall_time"],
+        "overall": stats(everything),
+        "callbacks": {label: stats(samples) for label, samples in run["results"].items()},
+    }
+    if memory is not None:
+        report["worker_peak_rss_mb"] = memory
+    return report
+
+
+def print_report(report):
+    """Print the report as a table"""
+    def fmt(value, spec=".1f"):
+        return "-" if value is None else format(value, spec)
+
+    print(f"{'callback':<28}{'reqs':>7}{'errors':>8}{'204s':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}")
+    rows = list(report["callbacks"].items()) + [("overall", report["overall"])]
+    for label, s in rows:
+        print(f"{label:<28}{s['requests']:>7}{s['errors']:>8}{s['no_update']:>6}{fmt(s['p50_ms']):>10}"
+              f"{fmt(s['p95_ms']):>10}{fmt(s['p99_ms']):>10}{fmt(s['throughput_rps']):>9}")
+    if report.get("worker_peak_rss_mb"):
+        print("\nPeak RSS per server process (MB):")
+        for pid, mb in sorted(report["worker_peak_rss_mb"].items()):
+            print(f"  {pid:<10}{mb:>10.1f}")
+        print(f"  {'total':<10}{sum(report['worker_peak_rss_mb'].values()):>10.1f}")
+
+
+def start_gunicorn(port, workers, threads):
+    """Start `gunicorn app:server` locally and wait until it answers"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:server", "--bind", f"127.0.0.1:{port}",
+         "--workers", str(workers), "--threads", str(threads), "--timeout", "120"],
+        cwd=Path(__file__).parent,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(240):
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            urllib.request.urlopen(url + "/", timeout=1).read()
+            return process, url
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("gunicorn did not become ready")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the dashboard's Dash callbacks")
+    parser.add_argument("--url", default="http://127.0.0.1:8050", help="Base URL of a running dashboard")
+    parser.add_argument("--sessions", help="Sessions JSON file or browser HAR export (default: built-in sessions)")
+    parser.add_argument("--users", type=int, default=8, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, help="Run for this many seconds")
+    parser.add_argument("--iterations", type=int, default=3, help="Sessions per user when no duration is given")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--pid", type=int, help="Server master pid to sample memory from")
+    parser.add_argument("--start-gunicorn", action="store_true", help="Start a local gunicorn instance for the run")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    server_process = None
+    url, pid = args.url, args.pid
+    if args.start_gunicorn:
+        server_process, url = start_gunicorn(args.port, args.workers, args.threads)
+        pid = server_process.pid
+
+    sampler = MemorySampler(pid) if pid and os.path.exists(f"/proc/{pid}") else None
+    try:
+        if sampler:
+            sampler.start()
+        run = run_load(url, load_sessions(args.sessions), args.users, args.duration, args.iterations, args.timeout)
+    finally:
+        if sampler:
+            sampler.stop()
+        if server_process:
+            server_process.terminate()
+            server_process.wait()
+
+    report = summarize(run, sampler.peak if sampler else None)
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2, default=str), encoding="utf-8")
@@ -0,0 +1,92 @@
+"""
+Per-request memory budgets for query results.
+
+Results are sized before they are materialized (selected rows times the
+bytes per row of the requested columns). Anything over
+PARTD_MEMORY_BUDGET_MB is either spilled to a temporary file under
+PARTD_SPILL_DIR by the streaming engine, or refused with
+MemoryBudgetExceeded, rather than growing the worker until it is killed.
+"""
+
+import os
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+MEMORY_BUDGET_MB = float(os.environ.get("PARTD_MEMORY_BUDGET_MB", 256))
+SPILL_DIR = Path(os.environ.get("PARTD_SPILL_DIR", Path(tempfile.gettempdir()) / "partd_spill"))
+# Spill files left behind by interrupted requests are removed after this many seconds
+SPILL_MAX_AGE = 3600
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    """Raised when a request's result would exceed its memory budget"""
+
+
+def budget_bytes(budget_mb=None):
+    """A budget in bytes; None uses PARTD_MEMORY_BUDGET_MB"""
+    return (MEMORY_BUDGET_MB if budget_mb is None else budget_mb) * 1024 * 1024
+
+
+def row_bytes(frame):
+    """Average in-memory bytes per row of a DataFrame"""
+    return frame.estimated_size() / frame.height if frame.height else 0
+
+
+def within_budget(n_rows, frame, budget_mb=None):
+    """Whether `n_rows` rows shaped like `frame` fit the budget"""
+    return n_rows * row_bytes(frame) <= budget_bytes(budget_mb)
+
+
+def check_budget(n_rows, frame, what, budget_mb=None):
+    """
+    Refuse results that would not fit the budget
+
+    Args:
+        n_rows: Rows the result will hold
+        frame: DataFrame with the result's columns, used to size a row
+        what: Description of the result for the error message
+
+    Raises:
+        MemoryBudgetExceeded: The estimated size is over budget
+    """
+    if not within_budget(n_rows, frame, budget_mb):
+        size_mb = n_rows * row_bytes(frame) / 1024 / 1024
+        raise MemoryBudgetExceeded(
+            f"{what} would use about {size_mb:,.1f} MB for {n_rows:,} rows, over the "
+            f"{budget_bytes(budget_mb) / 1024 / 1024:,.0f} MB per-request memory budget. "
+            "Narrow the filters, select fewer columns or use the CSV export."
+        )
+
+
+def spill_path(suffix):
+    """A new file path in SPILL_DIR, clearing out stale spill files first"""
+    SPILL_DIR.mkdir(parents=True, exist_ok=True)
+    cutoff = time.time() - SPILL_MAX_AGE
+    for path in SPILL_DIR.iterdir():
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except FileNotFoundError:
+            pass
+    return SPILL_DIR / f"{uuid.uuid4().hex}{suffix}"
+
+
+def spill(lazy_frame, suffix=".parquet"):
+    """
+    Stream a query's result to a spill file without collecting it
+
+    Args:
+        lazy_frame: Query to execute with the streaming engine
+        suffix: '.parquet' or '.csv'
+
+    Returns:
+        pathlib.Path: The spill file; callers delete it when done
+    """
+    path = spill_path(suffix)
+    if suffix == ".csv":
+        lazy_frame.sink_csv(path, engine="streaming")
+    else:
+        lazy_frame.sink_parquet(path, engine="streaming")
+    return path
@@ -0,0 +1,125 @@
+"""
+Outlier detection for the Outlier_Flag column.
+
+Rows are scored on spending per dosage unit against other products of the
+same drug (Generic_Name) in the same year, and on the year-over-year change
+in that price against the drug's other changes. A row is flagged when either
+score exceeds the threshold. All statistics are Polars window expressions,
+so re-flagging the full dataset is a single query, cached per
+(data version, parameters).
+"""
+
+from functools import lru_cache
+
+import polars as pl
+from polars import col as c
+
+from helpers import data_version, load_data
+from profiling import collect
+
+OUTLIER_METHODS = {
+    "zscore": "Robust z-score",
+    "iqr": "IQR fences",
+}
+DEFAULT_THRESHOLDS = {"zscore": 3.5, "iqr": 1.5}
+
+# Groups smaller than this are left unflagged (null), like the source data
+MIN_GROUP_SIZE = 4
+
+OUTLIER_COLUMNS = ["Product_Name", "Generic_Name", "Manufacturer", "YEAR", "Calc_Average_Spending_Per_Dosage_Unit"]
+
+PRICE_GROUP = ["Generic_Name", "YEAR"]
+CHANGE_GROUP = ["Generic_Name"]
+PRODUCT_KEY = ["Product_Name", "Generic_Name", "Manufacturer"]
+
+
+def _robust_zscore_outlier(value, group, threshold):
+    """|value - median| / (1.4826 * MAD) above threshold within each group"""
+    median = value.median().over(group)
+    mad = (value - median).abs().median().over(group) * 1.4826
+    score = (value - median).abs() / mad
+    return pl.when(mad > 0).then(score > threshold).otherwise(pl.lit(False))
+
+
+def _iqr_outlier(value, group, threshold):
+    """Value outside [Q1 - k * IQR, Q3 + k * IQR] within each group"""
+    q1 = value.quantile(0.25).over(group)
+    q3 = value.quantile(0.75).over(group)
+    iqr = q3 - q1
+    return (value < q1 - threshold * iqr) | (value > q3 + threshold * iqr)
+
+
+def flag_outliers(data, method="zscore", threshold=None):
+    """
+    Recompute Outlier_Flag (1 outlier, 0 not, null unscored)
+
+    Args:
+        data: Polars LazyFrame or DataFrame containing OUTLIER_COLUMNS
+        method: Key of OUTLIER_METHODS
+        threshold: Z-score cutoff or IQR multiplier; defaults per method
+
+    Returns:
+        The same frame type with Outlier_Flag replaced
+    """
+    if method not in OUTLIER_METHODS:
+        raise ValueError(f"Unknown outlier method: {method}")
+    if threshold is None:
+        threshold = DEFAULT_THRESHOLDS[method]
+    is_outlier = _robust_zscore_outlier if method == "zscore" else _iqr_outlier
+
+    # Materialize price and change first so each window runs once per column.
+    # Non-finite values (zero units, zero prior price) are treated as missing.
+    price = c.Calc_Average_Spending_Per_Dosage_Unit
+    change = c._price.pct_change().over(PRODUCT_KEY, order_by="YEAR")
+    return (
+        data
+        .with_columns(pl.when(price.is_finite()).then(price).alias("_price"))
+        .with_columns(pl.when(change.is_finite()).then(change).alias("_change"))
+        .with_columns(
+            is_outlier(c._price, PRICE_GROUP, threshold).fill_null(False).alias("_price_flag"),
+            is_outlier(c._change, CHANGE_GROUP, threshold).fill_null(False).alias("_change_flag"),
+            (c._price.is_not_null() & (c._price.count().over(PRICE_GROUP) >= MIN_GROUP_SIZE)).alias("_scored"),
+        )
+        .with_columns(
+            pl.when(c._scored).then((c._price_flag | c._change_flag).cast(pl.Int64)).alias("Outlier_Flag")
+        )
+        .drop("_price", "_change", "_price_flag", "_change_flag", "_scored")
+    )
+
+
+@lru_cache(maxsize=16)
+def _outlier_flags(version, method, threshold):
+    """Outlier_Flag for every row in file order, cached per data version and parameters"""
+    return collect(
+        flag_outliers(load_data(OUTLIER_COLUMNS), method, threshold).select("Outlier_Flag"),
+        "outlier_flags",
+        filters={"method": method, "threshold": threshold},
+    ).to_series()
+
+
+def outlier_flags(method="zscore", threshold=None):
+    """
+    Recomputed Outlier_Flag for the full dataset
+
+    Returns:
+        polars.Series: Flags aligned with the rows of load_data()
+    """
+    if threshold is None:
+        threshold = DEFAULT_THRESHOLDS.get(method)
+    return _outlier_flags(data_version(), method, float(threshold))
+
+
+def outlier_flags_for(params):
+    """
+    Recomputed flags for the dashboard's outlier settings
+
+    Args:
+        params: Dict with 'method' and 'threshold'; method 'source' or no
+            params keeps the precomputed Outlier_Flag
+
+    Returns:
+        polars.Series or None: Flags aligned with load_data() rows, or None
+    """
+    if not params or params.get("method") in (None, "source"):
+        return None
+    return outlier_flags(params["method"], params.get("threshold"))
@@ -0,0 +1,108 @@
+"""
+Opt-in query profiling for the lazy Polars pipelines.
+
+Set PARTD_PROFILE=1 to profile every query the dashboard collects. Queries
+slower than PARTD_SLOW_QUERY_MS (default 250ms) are written, together with
+their filter inputs, optimized plan and per-node timings, to a rotating log
+at logs/slow_queries.log (override with PARTD_PROFILE_LOG).
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+import polars as pl
+
+PROFILE_ENABLED = os.environ.get("PARTD_PROFILE", "").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.environ.get("PARTD_SLOW_QUERY_MS", 250))
+LOG_PATH = Path(os.environ.get("PARTD_PROFILE_LOG", Path(__file__).parent / "logs" / "slow_queries.log"))
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+_logger = None
+_logger_lock = threading.Lock()
+
+
+def get_logger():
+    """Return the slow-query logger, creating the rotating log file on first use"""
+    global _logger
+    # Slow queries are logged from several callback threads; only one may attach the file handler
+    with _logger_lock:
+        if _logger is None:
+            LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            _logger = logging.getLogger("partd.slow_queries")
+            _logger.setLevel(logging.INFO)
+            _logger.propagate = False
+            _logger.addHandler(handler)
+    return _logger
+
+
+def pushdown_summary(plan):
+    """
+    Summarize projection and predicate pushdown for every scan in a plan.
+
+    Args:
+        plan: Optimized plan text from LazyFrame.explain()
+
+    Returns:
+        list[dict]: One entry per scan with the projected column count and
+        whether a filter was pushed into the scan
+    """
+    scans = []
+    for line in plan.splitlines():
+        line = line.strip()
+        if " SCAN " in line or line.startswith("DF "):
+            scans.append({"scan": line, "projection": None, "selection": False})
+        if scans and "PROJECT" in line:
+            match = re.search(r"(\S+) COLUMNS", line)
+            scans[-1]["projection"] = match.group(1) if match else line
+        elif scans and line.startswith("SELECTION"):
+            scans[-1]["selection"] = True
+    return scans
+
+
+def collect(lazy_frame, name, filters=None, engine="auto"):
+    """
+    Collect a LazyFrame, profiling it when PARTD_PROFILE is set.
+
+    Args:
+        lazy_frame: Query to execute
+        name: Short label identifying the query in the log
+        filters: JSON-serializable filter inputs that produced the query
+        engine: Polars engine; "streaming" bounds memory for large inputs
+
+    Returns:
+        polars.DataFrame: The query result
+    """
+    if not PROFILE_ENABLED:
+        return lazy_frame.collect(engine=engine)
+
+    plan = lazy_frame.explain()
+    timings = None
+    start = time.perf_counter()
+    # LazyFrame.profile() was removed in Polars 2.0, fall back to wall-clock timing there
+    if hasattr(pl.LazyFrame, "profile"):
+        result, timings = lazy_frame.profile(engine=engine)
+    else:
+        result = lazy_frame.collect(engine=engine)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    if elapsed_ms >= SLOW_QUERY_MS:
+        record = {
+            "query": name,
+            "elapsed_ms": round(elapsed_ms, 2),
+            "rows": result.height,
+            "filters": filters,
+            "pushdown": pushdown_summary(plan),
+            "plan": plan,
+            "timings": timings.to_dicts() if timings is not None else None,
+        }
+        get_logger().info(json.dumps(record, default=str))
+    return result
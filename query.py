@@ -0,0 +1,254 @@
+"""
+Aggregate queries for the public API.
+
+A query is a filter (AG Grid filter model, or a {column: value(s)}
+shorthand), up to MAX_GROUP_BY group-by columns and a list of metrics.
+Queries are normalized to a canonical spec so equivalent requests share one
+cached result per data version, and cache hits never touch the data pool.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import polars as pl
+
+import data_service
+from figure import METRICS, metric_expr
+from grid_columns import COLUMNS
+from helpers import data_version
+from profiling import collect
+from session_cache import selections
+
+GROUP_COLUMNS = [
+    "Product_Name", "Generic_Name", "Manufacturer", "YEAR", "Brand_vs_Generic", "SPECIALTY_DRUG", "Outlier_Flag",
+]
+MAX_GROUP_BY = 3
+
+# Summed totals, METRICS ratios (re-derived from summed totals) and the row count
+QUERY_METRICS = {
+    "Total_Spending": ("Total_Spending", None),
+    "Total_Claims": ("Total_Claims", None),
+    "Total_Dosage_Units": ("Total_Dosage_Units", None),
+    "Total_Beneficiaries": ("Total_Beneficiaries", None),
+    **{
+        name: (definition["numerator"], definition["denominator"])
+        for name, definition in METRICS.items()
+        if definition["denominator"]
+    },
+    "rows": (None, None),
+}
+DEFAULT_METRICS = ["Total_Spending", "Total_Claims", "Calc_Average_Spending_Per_Claim"]
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = int(os.environ.get("PARTD_QUERY_MAX_ROWS", 10_000))
+QUERY_TIMEOUT = float(os.environ.get("PARTD_QUERY_TIMEOUT", 10))
+CACHE_SIZE = int(os.environ.get("PARTD_QUERY_CACHE_SIZE", 2048))
+# Cached results per worker are bounded by size too, so varied queries cannot outgrow the memory budget
+CACHE_MB = float(os.environ.get("PARTD_QUERY_CACHE_MB", 64))
+
+
+class QueryTimeout(RuntimeError):
+    """Raised when a query does not finish within QUERY_TIMEOUT seconds"""
+
+
+def _as_list(value):
+    """Accept a list or a comma separated string"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [part for part in value.split(",") if part]
+    return list(value)
+
+
+def equality_model(filters):
+    """
+    Convert a {column: value or [values]} shorthand to an AG Grid set filter model
+
+    Values are compared as strings, like the grid's set filters, so
+    {"YEAR": 2023} and {"SPECIALTY_DRUG": true} both work.
+    """
+    def key(value):
+        if value is None:
+            return None
+        if isinstance(value, bool):
+            return str(value).lower()
+        return str(value)
+
+    return {
+        column: {"filterType": "set", "values": [key(v) for v in (values if isinstance(values, list) else [values])]}
+        for column, values in (filters or {}).items()
+    }
+
+
+def parse_query(params):
+    """
+    Validate request parameters and normalize them to a query spec
+
+    Args:
+        params: Dict with optional "filterModel", "filter", "group_by",
+            "metrics", "sort", "descending" and "limit"
+
+    Returns:
+        dict: Canonical query spec
+
+    Raises:
+        ValueError: On unknown columns or metrics, or out of range limits
+    """
+    group_by = _as_list(params.get("group_by"))
+    unknown = [column for column in group_by if column not in GROUP_COLUMNS]
+    if unknown:
+        raise ValueError(f"Cannot group by: {', '.join(unknown)}. Group columns: {', '.join(GROUP_COLUMNS)}")
+    if len(group_by) > MAX_GROUP_BY:
+        raise ValueError(f"At most {MAX_GROUP_BY} group_by columns")
+
+    metrics = _as_list(params.get("metrics")) or DEFAULT_METRICS
+    unknown = [metric for metric in metrics if metric not in QUERY_METRICS]
+    if unknown:
+        raise ValueError(f"Unknown metrics: {', '.join(unknown)}. Metrics: {', '.join(QUERY_METRICS)}")
+
+    filter_model = params.get("filterModel") or {}
+    filters = params.get("filter") or {}
+    if not isinstance(filter_model, dict) or not isinstance(filters, dict):
+        raise ValueError("filterModel and filter must be objects keyed by column")
+    filter_model = {**equality_model(filters), **filter_model}
+    unknown = [column for column in filter_model if column not in COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown filter columns: {', '.join(unknown)}")
+    malformed = [column for column, condition in filter_model.items() if not isinstance(condition, dict)]
+    if malformed:
+        raise ValueError(f"Filter conditions must be AG Grid filter model objects: {', '.join(malformed)}")
+
+    sort = params.get("sort") or metrics[0]
+    if sort not in group_by and sort not in metrics:
+        raise ValueError(f"sort must be a group_by column or requested metric: {sort}")
+    limit = int(params.get("limit", DEFAULT_LIMIT))
+    if not 0 < limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+
+    descending = params.get("descending", True)
+    if isinstance(descending, str):
+        descending = descending.lower() not in ("false", "0", "no")
+
+    return {
+        "filterModel": filter_model,
+        "group_by": group_by,
+        "metrics": metrics,
+        "sort": sort,
+        "descending": bool(descending),
+        "limit": limit,
+    }
+
+
+def query_columns(spec):
+    """Columns a query reads for its groups and metrics"""
+    columns = list(spec["group_by"])
+    for metric in spec["metrics"]:
+        columns += [column for column in QUERY_METRICS[metric] if column and column not in columns]
+    return columns
+
+
+def run_query(spec):
+    """
+    Execute a query spec
+
+    Returns:
+        polars.DataFrame: One row per group (a single row without group_by),
+        sorted by spec["sort"] and truncated to spec["limit"]
+    """
+    aggregations = [
+        (pl.len() if metric == "rows" else metric_expr(*QUERY_METRICS[metric])).alias(metric)
+        for metric in spec["metrics"]
+    ]
+    # Indexed filter columns are resolved through the session cache's bitmap index
+    data = selections.lazy_rows(None, spec["filterModel"], query_columns(spec) or ["YEAR"])
+    data = data.group_by(spec["group_by"]).agg(aggregations) if spec["group_by"] else data.select(aggregations)
+    return collect(
+        data.sort(spec["sort"], descending=spec["descending"], nulls_last=True).head(spec["limit"]),
+        "api_query",
+        filters=spec,
+        engine="streaming",
+    )
+
+
+class QueryCache:
+    """
+    Query results keyed by data version and canonical query, evicted least recently used
+
+    Args:
+        max_entries: Most results kept
+        max_bytes: Most bytes kept (DataFrame estimated size, or length of bytes
+            results); unbounded when None
+    """
+
+    def __init__(self, max_entries=CACHE_SIZE, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def size(result):
+        """Bytes a cached result holds"""
+        return len(result) if isinstance(result, bytes) else result.estimated_size()
+
+    @staticmethod
+    def key(spec):
+        """Cache key of a query spec under the current data version"""
+        return json.dumps([data_version(), spec], sort_keys=True)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        return None
+
+    def put(self, key, result):
+        size = self.size(result)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self.size(self._entries.pop(key))
+            self._entries[key] = result
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self.size(evicted)
+
+
+results = QueryCache(max_bytes=CACHE_MB * 1024 * 1024)
+
+
+def cached_query(spec, timeout=QUERY_TIMEOUT):
+    """
+    Query result from the cache, or run on the data pool within a timeout
+
+    Returns:
+        tuple: (cache key, polars.DataFrame)
+
+    Raises:
+        ServiceBusy: No query slot freed up within `timeout` seconds
+        QueryTimeout: The query did not finish within `timeout` seconds of the
+            request, counting the wait for a slot; it still completes in the
+            background and is cached for the next request
+    """
+    key = results.key(spec)
+    data = results.get(key)
+    if data is not None:
+        return key, data
+
+    deadline = time.monotonic() + timeout
+    future = data_service.submit(run_query, spec, queue_timeout=timeout)
+    future.add_done_callback(lambda done: done.exception() is None and results.put(key, done.result()))
+    try:
+        return key, future.result(timeout=max(0, deadline - time.monotonic()))
+    except FutureTimeout:
+        raise QueryTimeout(f"Query did not finish within {timeout:g}s")
@@ -0,0 +1,214 @@
+"""
+Per-session cache of the grid's filtered selection.
+
+The chart, export and any other callback working on "the rows the user has
+filtered to" share one selection per browser session instead of each
+re-evaluating the filter model. A selection is stored as a Series of row
+indices into the in-memory dataset (not a copy of the rows) and expires
+after PARTD_SESSION_TTL seconds of inactivity.
+"""
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import polars as pl
+from polars.testing import assert_frame_equal
+
+from bitmap_index import INDEXED_COLUMNS, BitmapIndex
+from filter_model import filter_columns, filter_expr
+from helpers import data_version, load_data
+from incremental import Maintained
+from memory_budget import check_budget, spill
+from outliers import outlier_flags_for
+from profiling import collect
+
+SESSION_TTL = float(os.environ.get("PARTD_SESSION_TTL", 1800))
+MAX_SESSIONS = int(os.environ.get("PARTD_MAX_SESSIONS", 1000))
+
+
+def _load_frame(files):
+    """Rows of the given data files in memory"""
+    return collect(load_data(files=files), "base_frame")
+
+
+def _assert_same_index(extended, rebuilt):
+    """Fail unless two indexes map every value to the same rows"""
+    assert extended.n_rows == rebuilt.n_rows, f"{extended.n_rows} rows indexed, expected {rebuilt.n_rows}"
+    assert extended.row_sets() == rebuilt.row_sets(), "Bitmap index row sets differ"
+
+
+# The full dataset in memory, extended with appended years
+dataset = Maintained(
+    "base_frame",
+    build=_load_frame,
+    extend=lambda frame, files: pl.concat([frame, _load_frame(files)]),
+    compare=assert_frame_equal,
+)
+
+# Bitmap index over the dataset's rows; appended rows are indexed on their own and merged in
+selection_index = Maintained(
+    "bitmap_index",
+    build=lambda files: BitmapIndex.build(collect(load_data(INDEXED_COLUMNS, files), "bitmap_index")),
+    extend=lambda index, files: index.extend(collect(load_data(INDEXED_COLUMNS, files), "bitmap_index")),
+    compare=_assert_same_index,
+)
+
+
+def base_frame():
+    """The full dataset in memory; selections index into its rows"""
+    return dataset.get()
+
+
+def bitmap_index():
+    """Bitmap index over the rows of base_frame()"""
+    return selection_index.get()
+
+
+def warm_selection_index():
+    """Load the in-memory dataset and build its bitmap index ahead of the first request"""
+    base_frame()
+    bitmap_index()
+
+
+def _dataset(outlier_params=None):
+    """base_frame() with recomputed outlier flags applied when configured"""
+    frame = base_frame()
+    flags = outlier_flags_for(outlier_params)
+    if flags is not None:
+        frame = frame.with_columns(flags)
+    return frame
+
+
+class SessionSelections:
+    """Current filtered selection for each session, with TTL eviction"""
+
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(filter_model, outlier_params):
+        """Cache key for a selection; outlier settings only matter when filtering on Outlier_Flag"""
+        filter_model = filter_model or {}
+        outliers = outlier_params if "Outlier_Flag" in filter_model else None
+        return json.dumps([data_version(), filter_model, outliers], sort_keys=True)
+
+    def evict_expired(self):
+        """Drop selections idle for longer than the TTL"""
+        now = time.monotonic()
+        with self._lock:
+            for session_id in [s for s, entry in self._entries.items() if now - entry["used"] > self.ttl]:
+                del self._entries[session_id]
+
+    def selection(self, session_id, filter_model=None, outlier_params=None):
+        """
+        Row indices selected by a filter model, reused while the session's filters are unchanged
+
+        Args:
+            session_id: Browser session id; None disables caching
+            filter_model: The grid's filter model
+            outlier_params: The dashboard's outlier settings
+
+        Returns:
+            polars.Series or None: UInt32 row indices into base_frame(), or
+            None when nothing is filtered (all rows)
+        """
+        if not filter_model:
+            return None
+        key = self._key(filter_model, outlier_params)
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry["key"] == key:
+                entry["used"] = time.monotonic()
+                return entry["rows"]
+
+        rows = self._evaluate(filter_model, outlier_params)
+
+        if session_id is not None:
+            self.evict_expired()
+            with self._lock:
+                if session_id not in self._entries and len(self._entries) >= self.max_sessions:
+                    # Make room by dropping the least recently used session
+                    del self._entries[min(self._entries, key=lambda s: self._entries[s]["used"])]
+                self._entries[session_id] = {"key": key, "rows": rows, "used": time.monotonic()}
+        return rows
+
+    @staticmethod
+    def _evaluate(filter_model, outlier_params):
+        """Resolve indexed columns through the bitmap index, then scan only the remaining filters"""
+        # Recomputed outlier flags differ from the indexed source column
+        skip = ("Outlier_Flag",) if outlier_flags_for(outlier_params) is not None else ()
+        index = bitmap_index()
+        bitmap, residual = index.resolve(filter_model, skip)
+        rows = index.row_indices(bitmap) if bitmap is not None else None
+        if not residual:
+            return rows
+
+        frame = _dataset(outlier_params).select(filter_columns(residual))
+        if rows is None:
+            frame = frame.with_row_index("_row")
+        else:
+            frame = frame[rows].with_columns(rows)
+        return collect(
+            frame.lazy().filter(filter_expr(residual)).select("_row"),
+            "session_selection",
+            filters=residual,
+        ).to_series()
+
+    def count(self, session_id, filter_model=None, outlier_params=None):
+        """Number of rows the session's selection holds"""
+        selection = self.selection(session_id, filter_model, outlier_params)
+        return base_frame().height if selection is None else selection.len()
+
+    def lazy_rows(self, session_id, filter_model=None, columns=None, outlier_params=None):
+        """
+        The session's selected rows as a LazyFrame over the in-memory dataset
+
+        Rows are masked rather than gathered, so aggregations over any
+        selection stream through the dataset without copying it.
+        """
+        frame = _dataset(outlier_params)
+        if columns:
+            frame = frame.select(columns)
+        selection = self.selection(session_id, filter_model, outlier_params)
+        if selection is None:
+            return frame.lazy()
+        mask = np.zeros(frame.height, dtype=bool)
+        mask[selection.to_numpy()] = True
+        return frame.lazy().filter(pl.lit(pl.Series(mask)))
+
+    def rows(self, session_id, filter_model=None, columns=None, outlier_params=None, offset=0, limit=None):
+        """
+        The session's selected rows, gathering only the requested columns
+
+        Args:
+            offset: First selected row to return
+            limit: Maximum number of rows (all when None)
+
+        Returns:
+            polars.DataFrame: Selected rows in dataset order
+
+        Raises:
+            MemoryBudgetExceeded: The rows would not fit the per-request memory budget
+        """
+        frame = _dataset(outlier_params)
+        if columns:
+            frame = frame.select(columns)
+        selection = self.selection(session_id, filter_model, outlier_params)
+        if selection is None:
+            selection = pl.int_range(frame.height, dtype=pl.UInt32, eager=True)
+        selection = selection.slice(offset, limit)
+        check_budget(selection.len(), frame, "The selected rows")
+        return frame[selection]
+
+    def export_file(self, session_id, filter_model=None, columns=None, outlier_params=None, suffix=".csv"):
+        """Stream the session's selected rows to a spill file ('.csv' or '.parquet'), in bounded memory"""
+        return spill(self.lazy_rows(session_id, filter_model, columns, outlier_params), suffix)
+
+
+selections = SessionSelections()
@@ -0,0 +1,112 @@
+"""
+Server-side value lists for the grid's set filters.
+
+Distinct values and row counts are computed once for each filterable column
+and extended with the counts of appended years, and narrowed lists (values
+still available under the grid's other active filters) are cached per data
+version and filter model.
+"""
+
+import json
+from functools import lru_cache
+
+import polars as pl
+
+from helpers import data_version, load_data, query_data
+from incremental import Maintained, assert_rollup_equal, merge_sums
+from profiling import collect
+
+SET_FILTER_COLUMNS = [
+    "Manufacturer",
+    "Generic_Name",
+    "Brand_vs_Generic",
+    "SPECIALTY_DRUG",
+    "Outlier_Flag",
+    "YEAR",
+]
+
+
+def _count_values(files):
+    """Row counts per value of every set filter column in the given data files"""
+    data = load_data(SET_FILTER_COLUMNS, files)
+    return {
+        column: collect(
+            data.group_by(column).agg(pl.len().alias("count")).sort(column, nulls_last=True),
+            "set_filter_values",
+            filters={"column": column},
+        )
+        for column in SET_FILTER_COLUMNS
+    }
+
+
+def _assert_same_counts(extended, rebuilt):
+    """Fail unless every column's value counts match"""
+    for column in SET_FILTER_COLUMNS:
+        assert_rollup_equal(extended[column], rebuilt[column])
+
+
+# Unfiltered value lists; counts are additive, so appended years are merged in
+value_counts = Maintained(
+    "set_filter_values",
+    build=_count_values,
+    extend=lambda counts, files: {
+        column: merge_sums(counts[column], appended, [column])
+        for column, appended in _count_values(files).items()
+    },
+    compare=_assert_same_counts,
+)
+
+
+@lru_cache(maxsize=512)
+def _distinct_values(version, column, filter_key):
+    """Distinct values of `column` with row counts; cached per data version and filter"""
+    filter_model = json.loads(filter_key)
+    return collect(
+        query_data(filter_model, [column])
+        .group_by(column)
+        .agg(pl.len().alias("count"))
+        .sort(column, nulls_last=True),
+        "set_filter_values",
+        filters={"column": column, "filterModel": filter_model},
+    )
+
+
+def distinct_values(column, filter_model=None):
+    """
+    Distinct values of a filterable column with their row counts.
+
+    Args:
+        column: One of SET_FILTER_COLUMNS
+        filter_model: The grid's current filter model; the column's own
+            filter is ignored so its list is narrowed only by the others
+
+    Returns:
+        polars.DataFrame: Columns `column` and 'count', sorted by value
+    """
+    if column not in SET_FILTER_COLUMNS:
+        raise ValueError(f"Column does not support set filtering: {column}")
+    others = {key: value for key, value in (filter_model or {}).items() if key != column}
+    if not others:
+        return value_counts.get()[column]
+    return _distinct_values(data_version(), column, json.dumps(others, sort_keys=True))
+
+
+def _filter_key(value):
+    """AG Grid set filter key for a value: strings, with booleans as 'true'/'false'"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return str(value).lower()
+    return str(value)
+
+
+def set_filter_values(column, filter_model=None):
+    """Distinct values in the shape served to the grid: string keys with counts"""
+    values = distinct_values(column, filter_model)
+    return [{"value": _filter_key(value), "count": count} for value, count in values.iter_rows()]
+
+
+def precompute_set_filters():
+    """Warm the unfiltered value list of every set filter column"""
+    for column in SET_FILTER_COLUMNS:
+        distinct_values(column)
@@ -0,0 +1,152 @@
+"""
+Static snapshot of the default dashboard view.
+
+Run `python snapshot.py` to pre-render the default layout (including the
+grid rows and default figure), the default figure JSON and the
+pre-aggregated chart and set filter datasets into build/snapshot/
+(override with PARTD_SNAPSHOT_DIR). While the snapshot matches the current
+data version and app (layout and callbacks) the app serves these files
+as-is, with cache headers suitable for a CDN, and only runs Python for
+non-default interactions.
+"""
+
+import copy
+import gzip
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from helpers import data_version
+
+SNAPSHOT_DIR = Path(os.environ.get("PARTD_SNAPSHOT_DIR", Path(__file__).parent / "build" / "snapshot"))
+SNAPSHOT_MAX_AGE = int(os.environ.get("PARTD_SNAPSHOT_MAX_AGE", 3600))
+
+MANIFEST = "manifest.json"
+LAYOUT = "layout.json.gz"
+FIGURE = "figure.json"
+CHART_DATA = "chart_data.parquet"
+SET_FILTER_VALUES = "set_filter_values.json"
+
+
+def _write_gzip(path, text):
+    """Write text gzip-compressed so it can be served with Content-Encoding: gzip"""
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=9) as f:
+        f.write(text)
+
+
+def app_layout(app):
+    """An app's layout component, calling the layout function if it has one"""
+    return app.layout() if callable(app.layout) else app.layout
+
+
+def app_fingerprint(app):
+    """
+    Hash of an app's layout and callback dependencies
+
+    A snapshot built from a different layout or callback graph would wire the
+    browser to callbacks the server no longer has, so it is stale even when
+    the data is unchanged. Grid rows are left out; the data version covers them.
+    """
+    from dash import _callback
+
+    def encode(value):
+        if hasattr(value, "to_plotly_json"):
+            serialized = value.to_plotly_json()
+            if isinstance(serialized.get("props"), dict):
+                serialized["props"] = {k: v for k, v in serialized["props"].items() if k != "rowData"}
+            return serialized
+        raise TypeError(f"Cannot fingerprint {type(value).__name__}")
+
+    # Callbacks move from the global list to the app on its first request
+    callbacks = sorted(
+        (
+            {key: callback[key] for key in ("output", "inputs", "state", "prevent_initial_call")}
+            for callback in app._callback_list + _callback.GLOBAL_CALLBACK_LIST
+        ),
+        key=lambda callback: callback["output"],
+    )
+    text = json.dumps({"layout": app_layout(app), "dependencies": callbacks}, default=encode, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def build_snapshot(output_dir=SNAPSHOT_DIR):
+    """
+    Pre-render the default dashboard view into static files
+
+    Args:
+        output_dir: Directory to write the snapshot to
+
+    Returns:
+        dict: The snapshot manifest
+    """
+    # Imported here because the app itself loads snapshots at import time
+    import app as dashboard
+    from dash._utils import to_json
+    from figure import aggregate_chart_data, CHART_COLUMNS
+    from helpers import query_data
+    from set_filters import SET_FILTER_COLUMNS, set_filter_values
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    version = data_version()
+    fingerprint = app_fingerprint(dashboard.app)
+
+    figure, _ = dashboard.update_fig(None)
+    (output_dir / FIGURE).write_text(figure.to_json(), encoding="utf-8")
+
+    # Embed the default figure so the first page load needs no callback round trip;
+    # the snapshot version tells update_fig's initial call the figure is already there
+    layout = copy.deepcopy(app_layout(dashboard.app))
+    for component in layout._traverse():
+        if getattr(component, "id", None) == "fig":
+            component.figure = figure
+        elif getattr(component, "id", None) == "snapshot-version":
+            component.data = version
+    _write_gzip(output_dir / LAYOUT, to_json(layout))
+
+    aggregate_chart_data(query_data(None, CHART_COLUMNS)).collect().write_parquet(output_dir / CHART_DATA)
+    (output_dir / SET_FILTER_VALUES).write_text(
+        json.dumps({column: set_filter_values(column) for column in SET_FILTER_COLUMNS}),
+        encoding="utf-8",
+    )
+
+    manifest = {
+        "data_version": version,
+        "app_fingerprint": fingerprint,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "files": [FIGURE, LAYOUT, CHART_DATA, SET_FILTER_VALUES],
+    }
+    # Written last so a partially built snapshot is never picked up
+    (output_dir / MANIFEST).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return manifest
+
+
+def load_snapshot(fingerprint, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Load the snapshot manifest if it was built from the current data and app
+
+    Args:
+        fingerprint: app_fingerprint of the running app
+
+    Returns:
+        dict or None: The manifest, or None when missing or stale
+    """
+    manifest_path = Path(snapshot_dir) / MANIFEST
+    if not manifest_path.exists():
+        return None
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    if manifest.get("data_version") != data_version() or manifest.get("app_fingerprint") != fingerprint:
+        return None
+    return manifest
+
+
+def read_snapshot_file(name, snapshot_dir=SNAPSHOT_DIR):
+    """Read a snapshot file's raw bytes"""
+    return (Path(snapshot_dir) / name).read_bytes()
+
+
+if __name__ == "__main__":
+    manifest = build_snapshot()
+    print(f"Snapshot for data version {manifest['data_version']} written to {SNAPSHOT_DIR}")
@@ -0,0 +1,298 @@
+"""
+Synthetic Part D data generator for load and scale testing.
+
+Generates datasets with the exact schema load_data() returns, with
+controllable row counts, Generic_Name / Manufacturer cardinality and skewed
+(log-normal) spending. As in CMS data, each product (Product_Name,
+Generic_Name, Manufacturer) has one row per YEAR: row r is year
+r % len(years) of product r // len(years). Every value is derived from the
+product and row numbers with seeded hash expressions, so rows are generated
+lazily in batches and streamed to parquet in bounded memory.
+
+    python synthetic.py data/synthetic.parquet --rows 10000000
+
+Point the dashboard at the result with PARTD_DATA_PATH=data/synthetic.parquet.
+"""
+
+import argparse
+import math
+
+import polars as pl
+from polars import col as c
+
+# Schema and column order of data/partd.parquet
+PARTD_SCHEMA = {
+    "Product_Name": pl.String,
+    "Generic_Name": pl.String,
+    "Manufacturer": pl.String,
+    "Total_Spending": pl.Float64,
+    "Total_Dosage_Units": pl.Float64,
+    "Total_Claims": pl.Int64,
+    "Total_Beneficiaries": pl.Int64,
+    "Calc_Average_Spending_Per_Dosage_Unit": pl.Float64,
+    "Calc_Average_Spending_Per_Claim": pl.Float64,
+    "Calc_Average_Spending_Per_Beneficiary": pl.Float64,
+    "Outlier_Flag": pl.Int64,
+    "YEAR": pl.Int64,
+    "Brand_vs_Generic": pl.String,
+    "SPECIALTY_DRUG": pl.Boolean,
+}
+
+DEFAULT_YEARS = list(range(2015, 2024))
+BATCH_ROWS = 1_000_000
+
+# CMS suppresses counts below 11
+MIN_COUNT = 11
+
+NAME_PREFIXES = ["Ato", "Bupre", "Cela", "Dulo", "Esci", "Fluo", "Gaba", "Hydro", "Ibu", "Lamo",
+                 "Meto", "Nebi", "Olme", "Panto", "Quet", "Rosu", "Semi", "Tiro", "Vals", "Zolpi"]
+NAME_SUFFIXES = ["pril", "statin", "sartan", "olol", "pine", "zole", "mab", "tide", "cillin", "pam",
+                 "xetine", "done", "fenac", "gliptin", "vir", "tinib", "parin", "mycin", "triptan", "lukast"]
+BRAND_SUFFIXES = ["", " XR", " ER", " ODT", " Pen", " HFA"]
+MANUFACTURER_STEMS = ["Apex", "Bayview", "Cobalt", "Delta", "Everest", "Fairhaven", "Granite", "Harbor",
+                      "Ivory", "Juniper", "Keystone", "Lakeside", "Meridian", "Northstar", "Orion", "Pinnacle"]
+
+# Distribution parameters below are fitted to data/partd.parquet (2015-2023)
+
+# Products per Generic_Name and per Manufacturer, used to scale cardinality with --rows
+PRODUCTS_PER_GENERIC = 7.4
+PRODUCTS_PER_MANUFACTURER = 13
+
+# Product type mix and the share of each type flagged as a specialty drug
+PRODUCT_TYPES = [("Generic", 0.72), ("Brand", 0.24), ("DME", 0.036), ("Vaccine", 0.004)]
+SPECIALTY_SHARE = {"Generic": 0.03, "Brand": 0.29, "DME": 0.004, "Vaccine": 0.02}
+
+# Log-normal (mu, sigma) of claims per row, spending per claim per type and
+# dosage units per claim per type. Price per unit is derived from the two,
+# so drugs dispensed in many units per claim are cheap per unit, as in CMS data.
+CLAIMS = (8.6, 3.0)
+SPECIALTY_CLAIMS = (7.2, 2.4)
+PER_CLAIM_PARAMS = {"Generic": (4.0, 1.4), "Brand": (5.6, 1.5), "DME": (3.2, 1.0), "Vaccine": (4.8, 0.7)}
+SPECIALTY_PER_CLAIM = (8.5, 1.1)
+UNITS_PER_CLAIM = {"Generic": (4.0, 1.1), "Brand": (3.7, 1.5), "DME": (4.6, 0.6), "Vaccine": (-0.1, 0.7)}
+CLAIMS_PER_BENEFICIARY = (1.0, 0.5)
+# Correlation of log claims and log spending per claim: high volume drugs are cheaper per claim
+CLAIMS_PRICE_CORRELATION = -0.3
+# Normal draws are truncated here, bounding per-row maxima at any row count
+# (the largest real claim counts sit about 2.8 sigma out)
+MAX_SIGMAS = 2.75
+# Share of the claims and spending per claim draws that varies by year within
+# a product, giving year-over-year log changes of about 0.3 and 0.1
+CLAIMS_YEAR_SHARE = 0.1
+PER_CLAIM_YEAR_SHARE = 0.07
+
+
+def _uniform(index, seed, stream):
+    """Deterministic uniform [0, 1) value per row for an independent stream"""
+    return (index.hash(seed * 1_000_003 + stream) % (1 << 53)).cast(pl.Float64) / float(1 << 53)
+
+
+def _normal(index, seed, stream):
+    """Standard normal per row via the Box-Muller transform, truncated to MAX_SIGMAS"""
+    u1 = _uniform(index, seed, stream)
+    u2 = _uniform(index, seed, stream + 1)
+    return ((-2.0 * (1.0 - u1).log()).sqrt() * (2.0 * math.pi * u2).cos()).clip(-MAX_SIGMAS, MAX_SIGMAS)
+
+
+def _product_normal(product, row, seed, stream, year_share):
+    """Standard normal mostly fixed per product, with `year_share` of it drawn per row"""
+    level = math.sqrt(1 - year_share * year_share) * _normal(product, seed, stream)
+    return (level + year_share * _normal(row, seed, stream + 50)).clip(-MAX_SIGMAS, MAX_SIGMAS)
+
+
+def _by_type(params, specialty=None):
+    """Per-row (mu, sigma) expressions from a {product type: (mu, sigma)} mapping"""
+    mu, sigma = pl.lit(None, pl.Float64), pl.lit(None, pl.Float64)
+    for name, (type_mu, type_sigma) in params.items():
+        mu = pl.when(c.Brand_vs_Generic == name).then(type_mu).otherwise(mu)
+        sigma = pl.when(c.Brand_vs_Generic == name).then(type_sigma).otherwise(sigma)
+    if specialty:
+        mu = pl.when(c.SPECIALTY_DRUG).then(specialty[0]).otherwise(mu)
+        sigma = pl.when(c.SPECIALTY_DRUG).then(specialty[1]).otherwise(sigma)
+    return mu, sigma
+
+
+def _pick(options, position):
+    """Look up string options by integer position expression"""
+    return pl.lit(pl.Series(options)).gather(position % len(options))
+
+
+def product_cardinality(n_products, n_generics=None, n_manufacturers=None):
+    """
+    Resolve the Generic_Name and Manufacturer counts for `n_products` products
+
+    Counts left as None scale with the product count at the ratios of
+    data/partd.parquet.
+
+    Returns:
+        tuple: (n_generics, n_manufacturers)
+
+    Raises:
+        ValueError: If there are too few generics and manufacturers for every
+            product to have its own pair
+    """
+    if n_manufacturers is None:
+        n_manufacturers = max(1, round(n_products / PRODUCTS_PER_MANUFACTURER))
+    if n_generics is None:
+        n_generics = max(round(n_products / PRODUCTS_PER_GENERIC), math.ceil(n_products / n_manufacturers))
+    if math.ceil(n_products / n_manufacturers) > n_generics:
+        raise ValueError(
+            f"{n_products:,} products need more than {n_generics:,} generics x {n_manufacturers:,} manufacturers"
+        )
+    return n_generics, n_manufacturers
+
+
+def synthetic_batch(start, length, n_products, n_generics=None, n_manufacturers=None, years=None, skew=2.0, seed=0):
+    """
+    Lazily generate one batch of synthetic rows
+
+    Args:
+        start: Row number of the first row; rows are reproducible by row number
+        length: Number of rows in the batch
+        n_products: Number of distinct products in the whole dataset
+        n_generics: Number of distinct Generic_Name values, scaled with n_products when None
+        n_manufacturers: Number of distinct Manufacturer values, scaled with n_products when None
+        years: YEAR values each product has a row for
+        skew: Popularity skew; higher concentrates products in fewer drugs
+        seed: Random seed
+
+    Returns:
+        polars.LazyFrame: Rows matching PARTD_SCHEMA
+    """
+    years = years or DEFAULT_YEARS
+    n_generics, n_manufacturers = product_cardinality(n_products, n_generics, n_manufacturers)
+    i = c._row
+    product = i // len(years)
+
+    # Each manufacturer's products take consecutive generics from a skewed
+    # starting point, so no two products share a (generic, manufacturer) pair
+    manufacturer_id = (product % n_manufacturers).cast(pl.Int64)
+    generic_start = (_uniform(manufacturer_id, seed, 0).pow(skew) * n_generics).floor().cast(pl.Int64)
+    generic_id = ((product // n_manufacturers).cast(pl.Int64) + generic_start) % n_generics
+    # Product type by cumulative share of PRODUCT_TYPES
+    type_draw = _uniform(product, seed, 2)
+    (first_type, cumulative), *rest = PRODUCT_TYPES
+    product_type = pl.when(type_draw < cumulative).then(pl.lit(first_type))
+    for name, share in rest[:-1]:
+        cumulative += share
+        product_type = product_type.when(type_draw < cumulative).then(pl.lit(name))
+    product_type = product_type.otherwise(pl.lit(PRODUCT_TYPES[-1][0]))
+
+    specialty_share = pl.lit(0.0)
+    for name, share in SPECIALTY_SHARE.items():
+        specialty_share = pl.when(c.Brand_vs_Generic == name).then(share).otherwise(specialty_share)
+    specialty = _uniform(product, seed, 3) < specialty_share
+
+    claims_draw = _product_normal(product, i, seed, 10, CLAIMS_YEAR_SHARE)
+    claims_mu = pl.when(c.SPECIALTY_DRUG).then(SPECIALTY_CLAIMS[0]).otherwise(CLAIMS[0])
+    claims_sigma = pl.when(c.SPECIALTY_DRUG).then(SPECIALTY_CLAIMS[1]).otherwise(CLAIMS[1])
+    claims = (claims_mu + claims_sigma * claims_draw).exp().floor().cast(pl.Int64).clip(MIN_COUNT)
+    units_mu, units_sigma = _by_type(UNITS_PER_CLAIM)
+    units_per_claim = (units_mu + units_sigma * _normal(product, seed, 12)).exp()
+    claims_per_beneficiary = (
+        (CLAIMS_PER_BENEFICIARY[0] + CLAIMS_PER_BENEFICIARY[1] * _normal(i, seed, 14)).exp().clip(1.0)
+    )
+    per_claim_mu, per_claim_sigma = _by_type(PER_CLAIM_PARAMS, SPECIALTY_PER_CLAIM)
+    rho = CLAIMS_PRICE_CORRELATION
+    per_claim_draw = (
+        rho * claims_draw + math.sqrt(1 - rho * rho) * _product_normal(product, i, seed, 16, PER_CLAIM_YEAR_SHARE)
+    )
+    per_claim = (per_claim_mu + per_claim_sigma * per_claim_draw).exp()
+
+    generic_name = pl.concat_str(
+        _pick(NAME_PREFIXES, generic_id),
+        _pick(NAME_SUFFIXES, generic_id // len(NAME_PREFIXES)),
+        pl.when(generic_id >= len(NAME_PREFIXES) * len(NAME_SUFFIXES))
+        .then(pl.format(" {}", generic_id // (len(NAME_PREFIXES) * len(NAME_SUFFIXES))))
+        .otherwise(pl.lit("")),
+    )
+    manufacturer = pl.format(
+        "{} Pharma {}",
+        _pick(MANUFACTURER_STEMS, manufacturer_id),
+        manufacturer_id // len(MANUFACTURER_STEMS),
+    )
+    outlier_draw = _uniform(i, seed, 20)
+
+    return (
+        pl.LazyFrame()
+        .select(pl.int_range(start, start + length, dtype=pl.UInt64).alias("_row"))
+        .with_columns(
+            generic_name.alias("Generic_Name"),
+            manufacturer.alias("Manufacturer"),
+            product_type.alias("Brand_vs_Generic"),
+            pl.lit(pl.Series(years, dtype=pl.Int64)).gather(i % len(years)).alias("YEAR"),
+        )
+        .with_columns(
+            pl.when(c.Brand_vs_Generic == "Generic")
+            .then(c.Generic_Name)
+            .otherwise(pl.concat_str(c.Generic_Name.str.slice(0, 4), pl.lit("ora"), _pick(BRAND_SUFFIXES, product)))
+            .alias("Product_Name"),
+            specialty.alias("SPECIALTY_DRUG"),
+        )
+        .with_columns(claims.alias("Total_Claims"))
+        .with_columns(
+            (c.Total_Claims * units_per_claim).round(0).clip(1).alias("Total_Dosage_Units"),
+            # About a fifth of rows have suppressed beneficiary counts
+            pl.when(_uniform(i, seed, 6) >= 0.2)
+            .then((c.Total_Claims / claims_per_beneficiary).floor().cast(pl.Int64).clip(MIN_COUNT))
+            .alias("Total_Beneficiaries"),
+        )
+        .with_columns((c.Total_Claims * per_claim).round(2).alias("Total_Spending"))
+        .with_columns(
+            (c.Total_Spending / c.Total_Dosage_Units).alias("Calc_Average_Spending_Per_Dosage_Unit"),
+            (c.Total_Spending / c.Total_Claims).alias("Calc_Average_Spending_Per_Claim"),
+            (c.Total_Spending / c.Total_Beneficiaries).alias("Calc_Average_Spending_Per_Beneficiary"),
+            pl.when(outlier_draw < 0.32).then(None)
+            .when(outlier_draw < 0.39).then(1)
+            .otherwise(0)
+            .alias("Outlier_Flag"),
+        )
+        .select(c(name).cast(dtype) for name, dtype in PARTD_SCHEMA.items())
+    )
+
+
+def generate_synthetic(rows, batch_rows=BATCH_ROWS, years=None, **kwargs):
+    """
+    Lazily generate a synthetic dataset of `rows` rows
+
+    The rows cover ceil(rows / len(years)) products. Keyword arguments are
+    passed to synthetic_batch. Batches are concatenated lazily so the
+    streaming engine only holds a few batches at a time.
+    """
+    years = years or DEFAULT_YEARS
+    n_products = math.ceil(rows / len(years))
+    batches = [
+        synthetic_batch(start, min(batch_rows, rows - start), n_products, years=years, **kwargs)
+        for start in range(0, rows, batch_rows)
+    ]
+    return pl.concat(batches, how="vertical")
+
+
+def write_synthetic(path, rows, batch_rows=BATCH_ROWS, **kwargs):
+    """Stream a synthetic dataset to parquet with the same layout as data/partd.parquet"""
+    generate_synthetic(rows, batch_rows, **kwargs).sink_parquet(path, compression="zstd", engine="streaming")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic Part D dataset")
+    parser.add_argument("path", help="Output parquet file")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--generics", type=int, help="Distinct Generic_Name values (default: scaled with --rows)")
+    parser.add_argument("--manufacturers", type=int, help="Distinct Manufacturer values (default: scaled with --rows)")
+    parser.add_argument("--years", type=int, nargs="+", default=DEFAULT_YEARS)
+    parser.add_argument("--skew", type=float, default=2.0, help="Popularity skew (1 is uniform)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    args = parser.parse_args()
+
+    write_synthetic(
+        args.path,
+        args.rows,
+        batch_rows=args.batch_rows,
+        n_generics=args.generics,
+        n_manufacturers=args.manufacturers,
+        years=args.years,
+        skew=args.skew,
+        seed=args.seed,
+    )
+    print(f"Wrote {args.rows:,} synthetic rows to {args.path}")
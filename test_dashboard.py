@@ -0,0 +1,417 @@
+import threading
+
+import numpy as np
+import polars as pl
+import pytest
+from polars import col as c
+
+from bitmap_index import INDEXED_COLUMNS, BitmapIndex
+from comparison import COHORT_PRESETS, compare_cohorts, comparison_deltas
+from filter_model import column_expr, filter_expr
+from forecast import MIN_YEARS, fit_trends, forecast_chart_data
+from helpers import load_data
+import image_export
+from image_export import _image_options, render_views
+from loadtest import summarize
+import memory_budget
+from memory_budget import MemoryBudgetExceeded, check_budget
+from outliers import flag_outliers
+import profiling
+from query import CACHE_MB, QueryCache, parse_query, results
+from session_cache import selections
+from synthetic import PARTD_SCHEMA, generate_synthetic
+
+
+@pytest.fixture(scope="module")
+def data():
+    return load_data(INDEXED_COLUMNS).collect()
+
+
+@pytest.fixture(scope="module")
+def index(data):
+    return BitmapIndex.build(data)
+
+
+FILTER_MODELS = {
+    "text contains": {"Manufacturer": {"filterType": "text", "type": "contains", "filter": "pfizer"}},
+    "text contains empty": {"Manufacturer": {"filterType": "text", "type": "contains"}},
+    "text notEqual": {"Manufacturer": {"filterType": "text", "type": "notEqual", "filter": "Pfizer US Pharm"}},
+    "number blank": {"Outlier_Flag": {"filterType": "number", "type": "blank"}},
+    "text boolean true": {"SPECIALTY_DRUG": {"filterType": "text", "type": "true"}},
+    "text boolean false": {"SPECIALTY_DRUG": {"filterType": "text", "type": "false"}},
+    "number equals": {"YEAR": {"filterType": "number", "type": "equals", "filter": 2020}},
+    "number equals empty": {"YEAR": {"filterType": "number", "type": "equals"}},
+    "number inRange": {"YEAR": {"filterType": "number", "type": "inRange", "filter": 2016, "filterTo": 2019}},
+    "number combined": {
+        "YEAR": {
+            "filterType": "number",
+            "operator": "OR",
+            "conditions": [{"type": "lessThan", "filter": 2017}, {"type": "greaterThanOrEqual", "filter": 2022}],
+        }
+    },
+    "set": {"Brand_vs_Generic": {"filterType": "set", "values": ["Brand", "Generic"]}},
+    "set with null": {"Outlier_Flag": {"filterType": "set", "values": ["0", None]}},
+    "set boolean": {"SPECIALTY_DRUG": {"filterType": "set", "values": ["true"]}},
+    "multi": {
+        "Brand_vs_Generic": {
+            "filterType": "multi",
+            "filterModels": [{"filterType": "text", "type": "startsWith", "filter": "b"}, None],
+        }
+    },
+    "multi empty": {"Brand_vs_Generic": {"filterType": "multi", "filterModels": [None]}},
+    "stacked": {
+        "YEAR": {"filterType": "set", "values": ["2019", "2023"]},
+        "Brand_vs_Generic": {"filterType": "set", "values": ["Generic"]},
+        "Outlier_Flag": {"filterType": "set", "values": ["1"]},
+    },
+}
+# Filters without a value match every row; every other model must select some rows but not all
+NO_OP_FILTERS = {"text contains empty", "number equals empty", "multi empty"}
+
+
+@pytest.mark.parametrize("name, filter_model", FILTER_MODELS.items(), ids=FILTER_MODELS.keys())
+def test_index_matches_scan(data, index, name, filter_model):
+    bitmap, residual = index.resolve(filter_model)
+    assert residual == {}
+    scanned = data.with_row_index("_row").filter(filter_expr(filter_model))["_row"].to_numpy()
+    if name in NO_OP_FILTERS:
+        assert len(scanned) == data.height
+    else:
+        assert 0 < len(scanned) < data.height
+    np.testing.assert_array_equal(index.row_indices(bitmap).to_numpy(), scanned)
+
+
+def test_index_extend_matches_build(data):
+    split = data.height // 2
+    extended = BitmapIndex.build(data[:split]).extend(data[split:])
+    assert extended.row_sets() == BitmapIndex.build(data).row_sets()
+
+
+def test_unfiltered_values_are_broadcast(index):
+    bitmap = index.column_bitmap("Manufacturer", {"filterType": "text", "type": "contains"})
+    assert np.unpackbits(bitmap, count=index.n_rows).all()
+
+
+TRANSLATOR_FRAME = pl.DataFrame({
+    "name": ["Alpha", "beta", None, "ALPHABET"],
+    "amount": [1.0, 2.0, 3.0, None],
+    "flag": [True, False, None, True],
+})
+
+
+def matching(condition, column):
+    return TRANSLATOR_FRAME.with_row_index().filter(column_expr(column, condition))["index"].to_list()
+
+
+@pytest.mark.parametrize("condition, expected", [
+    ({"type": "contains", "filter": "alpha"}, [0, 3]),
+    ({"type": "notContains", "filter": "alpha"}, [1, 2]),
+    ({"type": "equals", "filter": "BETA"}, [1]),
+    ({"type": "notEqual", "filter": "beta"}, [0, 2, 3]),
+    ({"type": "startsWith", "filter": "al"}, [0, 3]),
+    ({"type": "endsWith", "filter": "bet"}, [3]),
+    ({"type": "blank"}, [2]),
+    ({"type": "notBlank"}, [0, 1, 3]),
+    ({"type": "contains"}, [0, 1, 2, 3]),
+])
+def test_text_filter(condition, expected):
+    assert matching({"filterType": "text", **condition}, "name") == expected
+
+
+@pytest.mark.parametrize("kind, expected", [("true", [0, 3]), ("false", [1])])
+def test_boolean_text_filter(kind, expected):
+    assert matching({"filterType": "text", "type": kind}, "flag") == expected
+
+
+@pytest.mark.parametrize("condition, expected", [
+    ({"type": "equals", "filter": 2}, [1]),
+    ({"type": "notEqual", "filter": 2}, [0, 2]),
+    ({"type": "greaterThan", "filter": 1}, [1, 2]),
+    ({"type": "lessThanOrEqual", "filter": 2}, [0, 1]),
+    ({"type": "inRange", "filter": 1, "filterTo": 3}, [1]),
+    ({"type": "blank"}, [3]),
+    ({"type": "equals"}, [0, 1, 2, 3]),
+])
+def test_number_filter(condition, expected):
+    assert matching({"filterType": "number", **condition}, "amount") == expected
+
+
+def test_set_filter_matches_string_keys_and_nulls():
+    assert matching({"filterType": "set", "values": ["true"]}, "flag") == [0, 3]
+    assert matching({"filterType": "set", "values": ["false", None]}, "flag") == [1, 2]
+    assert matching({"filterType": "set", "values": []}, "flag") == []
+
+
+def test_combined_and_multi_filters():
+    either = {
+        "filterType": "number",
+        "operator": "OR",
+        "conditions": [{"type": "lessThan", "filter": 2}, {"type": "greaterThan", "filter": 2}],
+    }
+    assert matching(either, "amount") == [0, 2]
+    legacy = {
+        "filterType": "text",
+        "operator": "AND",
+        "condition1": {"type": "startsWith", "filter": "alpha"},
+        "condition2": {"type": "endsWith", "filter": "bet"},
+    }
+    assert matching(legacy, "name") == [3]
+    multi = {"filterType": "multi", "filterModels": [None, {"filterType": "set", "values": ["beta"]}]}
+    assert matching(multi, "name") == [1]
+
+
+def test_filter_expr_combines_columns():
+    filter_model = {
+        "name": {"filterType": "text", "type": "contains", "filter": "alpha"},
+        "flag": {"filterType": "set", "values": ["true"]},
+        "amount": {"filterType": "number", "type": "notBlank"},
+    }
+    assert TRANSLATOR_FRAME.filter(filter_expr(filter_model)).height == 1
+    assert TRANSLATOR_FRAME.filter(filter_expr({})).height == TRANSLATOR_FRAME.height
+
+
+def test_unsupported_filter_type():
+    with pytest.raises(ValueError):
+        column_expr("name", {"filterType": "date", "type": "equals"})
+
+
+@pytest.mark.parametrize("filter_model", [{"name": "x"}, ["name"]])
+def test_malformed_filter_model(filter_model):
+    with pytest.raises(ValueError):
+        filter_expr(filter_model)
+
+
+@pytest.mark.parametrize("params", [
+    {"filterModel": {"YEAR": "x"}},
+    {"filterModel": ["YEAR"]},
+    {"filter": "YEAR"},
+    {"filterModel": {"Unknown": {"filterType": "set", "values": []}}},
+    {"group_by": "YEAR,Manufacturer,Brand_vs_Generic,SPECIALTY_DRUG"},
+    {"limit": 0},
+])
+def test_parse_query_rejects_malformed_requests(params):
+    with pytest.raises(ValueError):
+        parse_query(params)
+
+
+def test_parse_query_merges_filter_shorthand():
+    spec = parse_query({"filter": {"YEAR": 2023, "SPECIALTY_DRUG": True}, "group_by": "Brand_vs_Generic"})
+    assert spec["filterModel"] == {
+        "YEAR": {"filterType": "set", "values": ["2023"]},
+        "SPECIALTY_DRUG": {"filterType": "set", "values": ["true"]},
+    }
+    assert spec["group_by"] == ["Brand_vs_Generic"]
+
+
+def test_query_cache_bounds_bytes():
+    cache = QueryCache(max_entries=10, max_bytes=100)
+    for key in range(5):
+        cache.put(key, b"x" * 40)
+    assert [cache.get(key) is not None for key in range(5)] == [False, False, False, True, True]
+    cache.put("too large", b"x" * 200)
+    assert cache.get("too large") is None
+    assert cache.get(4) is not None
+
+
+def test_query_cache_bounds_dataframe_bytes():
+    frame = pl.DataFrame({"value": range(1000)}, schema={"value": pl.Int64})
+    cache = QueryCache(max_entries=100, max_bytes=frame.estimated_size() * 2)
+    for key in range(4):
+        cache.put(key, frame)
+    assert [cache.get(key) is not None for key in range(4)] == [False, False, True, True]
+
+
+def test_query_results_cache_has_byte_limit():
+    assert results.max_bytes == CACHE_MB * 1024 * 1024
+
+
+@pytest.mark.parametrize("width, height, scale", [(4000, 600, 2), (1200, 2001, 2), (0, 600, 1), (1200, 600, 5)])
+def test_image_options_cap_output_pixels(width, height, scale):
+    with pytest.raises(ValueError):
+        _image_options("png", width, height, scale)
+
+
+def test_render_views_batches_uncached_views(monkeypatch):
+    calls = []
+
+    def write_images(figures, paths, **options):
+        calls.append(len(figures))
+        for figure, path in zip(figures, paths):
+            path.write_bytes(figure.encode())
+
+    monkeypatch.setattr(image_export, "_check_render", lambda fmt: None)
+    monkeypatch.setattr(image_export, "chart_figure", lambda filter_model, forecast, label: f"chart {label}")
+    monkeypatch.setattr(image_export.pio, "write_images", write_images)
+    options = {"width": 321, "height": 123, "scale": 1}
+    assert render_views(["brand", "generic"], **options) == {"brand": b"chart Brand", "generic": b"chart Generic"}
+    assert render_views(["generic", "specialty", "brand"], **options) == {
+        "generic": b"chart Generic", "specialty": b"chart Specialty", "brand": b"chart Brand",
+    }
+    assert calls == [2, 1]
+
+
+def test_synthetic_rows_have_unique_product_years():
+    frame = generate_synthetic(5000, batch_rows=1200, years=[2021, 2022, 2023]).collect()
+    assert frame.schema == pl.Schema(PARTD_SCHEMA)
+    assert frame.height == 5000
+    assert frame.select(pl.struct("Product_Name", "Generic_Name", "Manufacturer", "YEAR").n_unique()).item() == 5000
+    assert frame.select(pl.struct("Product_Name", "Generic_Name", "Manufacturer").n_unique()).item() == 1667
+
+
+def test_summarize_counts_any_2xx_as_success():
+    run = {"wall_time": 2.0, "results": {"update_fig": [(200, 0.1, 10), (204, 0.2, 0), (500, 5.0, 0), (0, 9.0, 0)]}}
+    report = summarize(run)["callbacks"]["update_fig"]
+    assert (report["requests"], report["errors"], report["no_update"]) == (4, 2, 1)
+    assert report["p99_ms"] <= 200
+
+
+def outlier_frame():
+    """Drug A has a price outlier, B a year-over-year jump, C too few products, D a zero MAD, E non-finite prices"""
+    prices = [
+        *[("A", 2022, price) for price in [1.0, 1.1, 0.9, 1.05, 0.95, 10.0]],
+        *[("B", 2021, price) for price in [0.4, 0.5, 0.6, 0.7, 0.8]],
+        *[("B", 2022, price) for price in [0.8, 0.51, 0.6, 0.69, 0.81]],
+        *[("C", 2022, price) for price in [1.0, 1.0, 50.0]],
+        *[("D", 2022, price) for price in [2.0, 2.0, 2.0, 2.0, 9.0]],
+        *[("E", 2022, price) for price in [1.0, 1.1, 0.9, 1.2, float("inf"), float("nan")]],
+    ]
+    products = {}
+    rows = []
+    for generic, year, price in prices:
+        n = products[generic, year] = products.get((generic, year), 0) + 1
+        rows.append((f"{generic}{n}", generic, "M", year, price))
+    return pl.DataFrame(rows, schema=["Product_Name", "Generic_Name", "Manufacturer", "YEAR",
+                                      "Calc_Average_Spending_Per_Dosage_Unit"], orient="row")
+
+
+@pytest.mark.parametrize("method, flagged", [("zscore", {"A6", "B1"}), ("iqr", {"A6", "B1", "D5"})])
+def test_flag_outliers(method, flagged):
+    flags = flag_outliers(outlier_frame(), method).filter(c.YEAR == 2022)
+    unscored = {"C1", "C2", "C3", "E5", "E6"}
+    expected = [None if name in unscored else int(name in flagged) for name in flags["Product_Name"]]
+    assert flags["Outlier_Flag"].to_list() == expected
+    assert flag_outliers(outlier_frame(), method).filter(c.YEAR == 2021)["Outlier_Flag"].to_list() == [0] * 5
+
+
+def growth_series(years, growth=0.1):
+    return pl.DataFrame({
+        "year": years,
+        "total_spending": [1000 * (1 + growth) ** (year - years[0]) for year in years],
+        "per_claim": [50 * (1 + growth / 2) ** (year - years[0]) for year in years],
+    })
+
+
+def test_fit_trends_recovers_exponential_growth():
+    fits = fit_trends(growth_series(list(range(2015, 2021))), ["total_spending", "per_claim"])
+    assert fits["total_spending_slope"].item() == pytest.approx(np.log(1.1))
+    assert fits["total_spending_growth"].item() == pytest.approx(0.1)
+    assert fits["per_claim_growth"].item() == pytest.approx(0.05)
+    forecast = forecast_chart_data(growth_series(list(range(2015, 2021))))
+    assert forecast["year"].to_list() == [2021]
+    assert forecast["total_spending"].item() == pytest.approx(1000 * 1.1 ** 6)
+
+
+def test_fit_trends_needs_min_years():
+    years = list(range(2015, 2015 + MIN_YEARS - 1))
+    fits = fit_trends(growth_series(years), ["total_spending"])
+    assert fits["total_spending_slope"].item() is None
+    assert forecast_chart_data(growth_series(years)).is_empty()
+
+
+def test_fit_trends_ignores_non_positive_values():
+    series = growth_series(list(range(2015, 2021))).with_columns(
+        pl.when(c.year == 2016).then(0.0).when(c.year == 2018).then(-5.0).otherwise(c.total_spending)
+        .alias("total_spending")
+    )
+    fits = fit_trends(series, ["total_spending"])
+    assert fits["total_spending_growth"].item() == pytest.approx(0.1)
+    assert fit_trends(series.filter(c.year <= 2018), ["total_spending"])["total_spending_slope"].item() is None
+
+
+def test_check_budget_refuses_oversized_results():
+    frame = pl.DataFrame({"value": range(100)}, schema={"value": pl.Int64})
+    check_budget(1000, frame, "Rows", budget_mb=1)
+    with pytest.raises(MemoryBudgetExceeded):
+        check_budget(1_000_000, frame, "Rows", budget_mb=1)
+
+
+def test_rows_are_sliced_before_the_budget_check(monkeypatch, data):
+    monkeypatch.setattr(memory_budget, "MEMORY_BUDGET_MB", 0.01)
+    page = selections.rows(None, {}, ["Manufacturer", "YEAR"], offset=10, limit=5)
+    assert page.equals(data.select("Manufacturer", "YEAR")[10:15])
+    with pytest.raises(MemoryBudgetExceeded):
+        selections.rows(None, {}, ["Manufacturer", "YEAR"])
+
+
+@pytest.fixture(scope="module")
+def dashboard():
+    import app
+    return app
+
+
+def test_download_streams_exports_over_budget(monkeypatch, dashboard):
+    import data_service
+    monkeypatch.setattr(data_service, "export_fits", lambda *args: False)
+    monkeypatch.setattr(data_service, "export_csv", lambda *args: pytest.fail("export_csv called"))
+    download, href = dashboard.download_csv(1, {"YEAR": {"filterType": "set", "values": ["2023"]}}, ["YEAR"])
+    assert download is dashboard.no_update
+    assert href.startswith("/api/export.csv?columns=YEAR&filterModel=")
+
+
+def test_api_returns_413_over_budget(monkeypatch, dashboard):
+    monkeypatch.setattr(memory_budget, "MEMORY_BUDGET_MB", 0.01)
+    response = dashboard.server.test_client().get("/api/rows?limit=10000")
+    assert response.status_code == 413
+    assert "memory budget" in response.get_json()["error"]
+
+
+COHORT_FRAME = pl.DataFrame({
+    "YEAR": [2022, 2022, 2023, 2023],
+    "Brand_vs_Generic": ["Brand", "Generic", "Brand", "Generic"],
+    "SPECIALTY_DRUG": [True, False, False, True],
+    "Total_Spending": [100.0, 20.0, 50.0, 30.0],
+    "Total_Claims": [10, 5, 0, 3],
+})
+
+
+def test_compare_cohorts_counts_overlapping_rows_in_both():
+    result = compare_cohorts(COHORT_FRAME, [COHORT_PRESETS["brand"], COHORT_PRESETS["specialty"]])
+    assert result.rows() == [
+        (2022, "Brand", 100.0, 10, 10.0),
+        (2022, "Specialty", 100.0, 10, 10.0),
+        (2023, "Brand", 50.0, 0, None),
+        (2023, "Specialty", 30.0, 3, 10.0),
+    ]
+
+
+def test_comparison_deltas_keep_years_missing_from_one_cohort():
+    compared = pl.DataFrame({
+        "year": [2022, 2022, 2023],
+        "cohort": ["Brand", "Generic", "Generic"],
+        "total_spending": [100.0, 20.0, 30.0],
+        "per_claim": [10.0, 4.0, 10.0],
+    })
+    deltas = comparison_deltas(compared, "Brand", "Generic")
+    assert deltas["year"].to_list() == [2022, 2023]
+    assert deltas.row(0, named=True)["spending_delta"] == -80.0
+    missing = deltas.row(1, named=True)
+    assert (missing["spending_a"], missing["spending_b"], missing["spending_delta"]) == (None, 30.0, None)
+
+
+def test_slow_query_logger_is_created_once(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "LOG_PATH", tmp_path / "slow_queries.log")
+    monkeypatch.setattr(profiling, "_logger", None)
+    loggers = []
+    threads = [threading.Thread(target=lambda: loggers.append(profiling.get_logger())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logger = loggers[0]
+    try:
+        assert len(loggers) == 8 and all(other is logger for other in loggers)
+        assert len(logger.handlers) == 1
+    finally:
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()